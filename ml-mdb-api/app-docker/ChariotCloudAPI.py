@@ -13,9 +13,30 @@ import json
 from argparse import ArgumentParser
 import GenericMachineLearningAPI
 import MongoDBDriver
+import JobQueue
+import ModelCache
+import MicroBatcher
+import ModelPreloader
 import sys
 import pandas as pd
 import os
+import signal
+import multiprocessing
+from bson import json_util
+from bson.objectid import ObjectId
+
+try:
+    from cheroot import wsgi as cherootwsgi
+    CHEROOT_INSTALLED = True
+except ImportError:
+    CHEROOT_INSTALLED = False
+
+try:
+    from gunicorn.app.base import BaseApplication
+    GUNICORN_INSTALLED = True
+except ImportError:
+    BaseApplication = object
+    GUNICORN_INSTALLED = False
 
 # Global variables and arugument passing
 
@@ -32,6 +53,55 @@ parser.add_argument("-db", "--authentication-database", dest="authdb", nargs='?'
     help="authentication database")
 parser.add_argument("-port", "--mongo-db-port", dest="mongodbport", nargs='?', const='Invalid',\
     help="MongoDB port")
+parser.add_argument("--mongo-max-pool-size", dest="maxpoolsize", type=int,\
+    help="maximum number of pooled connections per MongoDB client (default: 100)")
+parser.add_argument("--mongo-min-pool-size", dest="minpoolsize", type=int,\
+    help="minimum number of pooled connections kept open (default: 0)")
+parser.add_argument("--mongo-connect-timeout", dest="connecttimeout", type=int,\
+    help="MongoDB connect timeout in ms (default: 20000)")
+parser.add_argument("--mongo-socket-timeout", dest="sockettimeout", type=int,\
+    help="MongoDB socket timeout in ms (default: no timeout)")
+parser.add_argument("--mongo-server-selection-timeout", dest="selectiontimeout", type=int,\
+    help="MongoDB server selection timeout in ms (default: 30000)")
+parser.add_argument("--mongo-wait-queue-timeout", dest="waitqueuetimeout", type=int,\
+    help="maximum time in ms to wait for a free pooled connection (default: no timeout)")
+parser.add_argument("-s", "--server-mode", dest="servermode", choices=["simple", "threaded", "prefork"], default="simple",\
+    help="simple: web.py development server, threaded: multi-threaded cheroot server, "
+         "prefork: gunicorn with several worker processes (default: simple)")
+parser.add_argument("-w", "--workers", dest="workers", type=int, default=multiprocessing.cpu_count(),\
+    help="number of worker processes in prefork mode (default: number of cores)")
+parser.add_argument("-t", "--threads", dest="threads", type=int, default=10,\
+    help="number of request threads (per worker in prefork mode) (default: 10)")
+parser.add_argument("--backlog", dest="backlog", type=int, default=2048,\
+    help="maximum number of pending connections (default: 2048)")
+parser.add_argument("--keep-alive", dest="keepalive", type=int, default=5,\
+    help="seconds to wait for the next request on a keep-alive connection, prefork mode (default: 5)")
+parser.add_argument("--request-timeout", dest="requesttimeout", type=int, default=300,\
+    help="seconds before an idle connection (threaded) or a silent worker (prefork) is dropped (default: 300)")
+parser.add_argument("--graceful-timeout", dest="gracefultimeout", type=int, default=30,\
+    help="seconds running requests get to finish on shutdown (default: 30)")
+parser.add_argument("--train-workers", dest="trainworkers", type=int, default=1,\
+    help="number of background training jobs run at the same time (default: 1)")
+parser.add_argument("--train-queue-size", dest="trainqueuesize", type=int, default=16,\
+    help="maximum number of waiting background training jobs (default: 16)")
+parser.add_argument("--jobs-database", dest="jobsdatabase", default="predictive_maintenance",\
+    help="database of the table the status of the background jobs is shared in between the server processes, empty keeps it in memory (default: predictive_maintenance)")
+parser.add_argument("--model-cache-size", dest="modelcachesize", type=int, default=128,\
+    help="maximum number of deserialized models kept in memory, 0 disables the cache (default: 128)")
+parser.add_argument("--model-cache-mb", dest="modelcachemb", type=int, default=512,\
+    help="maximum size of the cached models in MB (default: 512)")
+parser.add_argument("--predict-batch-ms", dest="predictbatchms", type=float, default=0,\
+    help="milliseconds concurrent real-time predictions for the same model are collected into one batch, 0 disables batching (default: 0)")
+parser.add_argument("--predict-batch-size", dest="predictbatchsize", type=int, default=64,\
+    help="maximum number of rows of a prediction batch (default: 64)")
+parser.add_argument("--preload-models", dest="preloadmodels", action="store_true",\
+    help="load the latest model of every device into the model cache at startup")
+parser.add_argument("--preload-databases", dest="preloaddatabases", default="predictive_maintenance",\
+    help="comma separated databases searched for models to preload (default: predictive_maintenance)")
+parser.add_argument("--preload-workers", dest="preloadworkers", type=int, default=4,\
+    help="number of models preloaded at the same time (default: 4)")
+parser.add_argument("--preload-idname", dest="preloadidname", default="deviceID",\
+    help="field of the model records holding the device id, as used by the predict requests (default: deviceID)")
 
 args = parser.parse_args()
 
@@ -63,6 +133,20 @@ webport  = weblink_list[1]
 link = "mongodb://" + host + ":" + monogdbport
 print (link)
 
+# All MongoDBAPI objects share the pooled clients of this registry
+MongoDBDriver.clientRegistry.configure(maxPoolSize = args.maxpoolsize,
+                                       minPoolSize = args.minpoolsize,
+                                       connectTimeoutMS = args.connecttimeout,
+                                       socketTimeoutMS = args.sockettimeout,
+                                       serverSelectionTimeoutMS = args.selectiontimeout,
+                                       waitQueueTimeoutMS = args.waitqueuetimeout)
+
+JobQueue.trainingJobs.configure(workers = args.trainworkers, maxsize = args.trainqueuesize, database = args.jobsdatabase)
+ModelCache.modelCache.configure(max_entries = args.modelcachesize, max_bytes = args.modelcachemb * 1024 * 1024)
+MicroBatcher.predictBatcher.configure(max_latency = args.predictbatchms / 1000.0, max_batch = args.predictbatchsize)
+ModelPreloader.modelPreloader.configure(databases = [db for db in args.preloaddatabases.split(",") if db],
+                                        workers = args.preloadworkers, idname = args.preloadidname)
+
 class WebServer():
     """
     Webserver to server links
@@ -79,6 +163,7 @@ class WebServer():
 
             # DB APIs
             '/cloud/db/getTableData/', 'GetTableData',
+            '/cloud/db/streamTableData/', 'StreamTableData',
             '/cloud/db/getTableDataByID/', 'GetTableDataByID',
             '/cloud/db/getLatestData/', 'GetLatestData',
             '/cloud/db/updateOneInTable/', 'UpdateOneInTable',          # Rename from updateTableById
@@ -88,6 +173,8 @@ class WebServer():
             '/cloud/db/writeOneRowInTable/', 'WriteOneRowInTable',      # Rename from writeRowInTable
             '/cloud/db/deleteDatabase/', 'DeleteDatabase',
             '/cloud/db/deleteTable/', 'DeleteTable',                    # Rename DeleteTableEntries
+            '/cloud/db/poolStats/', 'PoolStats',
+            '/cloud/db/indexes/', 'TableIndexes',
 
             # # KMS Interface APIs
             # '/cloud/db/kms/copyKMSToMLDB/', 'KMSInterfaceAPI.CopyKMSToMLDB',    # Copy KMS DB History Data To ML DB
@@ -102,31 +189,162 @@ class WebServer():
             # ML APIs
             '/cloud/ml/ga/GAControl/', 'GenericMachineLearningAPI.GenericGeneticAlgorithmControl',
             '/cloud/ml/generic/train/', 'GenericMachineLearningAPI.GenericTrain',
+            '/cloud/ml/generic/train/search/', 'GenericMachineLearningAPI.GenericTrainSearch',
             '/cloud/ml/generic/predict/', 'GenericMachineLearningAPI.GenericPredict',
-            '/cloud/ml/generic/plot/', 'GenericMachineLearningAPI.GenericPlot'
+            '/cloud/ml/generic/predict/bulk/', 'GenericMachineLearningAPI.GenericBulkPredict',
+            '/cloud/ml/generic/plot/', 'GenericMachineLearningAPI.GenericPlot',
+            '/cloud/ml/modelCache/', 'GenericMachineLearningAPI.ModelCacheStats',
+            '/cloud/ml/preload/', 'GenericMachineLearningAPI.ModelPreload',
+            '/cloud/ml/ready/', 'GenericMachineLearningAPI.Ready',
+            '/cloud/ml/predictBatching/', 'GenericMachineLearningAPI.PredictBatchStats',
+            '/cloud/ml/jobs/', 'GenericMachineLearningAPI.JobList',
+            '/cloud/ml/jobs/status/', 'GenericMachineLearningAPI.JobStatus'
 
         )
 
     def startApp(self):
         """
-        Starts application
+        Starts application in the server mode given by -s
         :return:
         """
-        print("Starting ChariotCloud API")
+        print("Starting ChariotCloud API (%s mode)" % args.servermode)
         app = web.application(self.urls, globals())
+
+        # Preloading runs in the background, /cloud/ml/ready/ reports when it finished.
+        # In prefork mode every worker preloads its own cache after the fork.
+        if args.preloadmodels and args.servermode != "prefork":
+            ModelPreloader.modelPreloader.start()
+
+        if args.servermode == "threaded":
+            return self.runThreaded(app.wsgifunc())
+        elif args.servermode == "prefork":
+            return self.runPrefork(app.wsgifunc())
+
         # set the ip and port for the API
         app2 = web.httpserver.runsimple(app.wsgifunc(), (webhost, int(webport)))
         return app2
 
+    def runThreaded(self, wsgifunc):
+        """
+        Serves the app with a thread pool in this process. Stops gracefully on SIGTERM / SIGINT.
+        """
+        if not CHEROOT_INSTALLED:
+            raise Exception("threaded mode requires cheroot (pip3 install cheroot)")
+
+        server = cherootwsgi.Server((webhost, int(webport)), wsgifunc,
+                                    numthreads = args.threads,
+                                    request_queue_size = args.backlog,
+                                    timeout = args.requesttimeout,
+                                    shutdown_timeout = args.gracefultimeout)
+
+        def stop(signum, frame):
+            raise SystemExit(0)
+        signal.signal(signal.SIGTERM, stop)
+
+        print("Serving on %s:%s with %d threads" % (webhost, webport, args.threads))
+        # safe_start stops the server and waits for running requests on SystemExit / KeyboardInterrupt
+        server.safe_start()
+        return server
+
+    def runPrefork(self, wsgifunc):
+        """
+        Serves the app with gunicorn: several forked worker processes with a thread pool each.
+        The pooled MongoClients are created per worker after the fork.
+        """
+        if not GUNICORN_INSTALLED:
+            raise Exception("prefork mode requires gunicorn (pip3 install gunicorn)")
+
+        options = {
+            "bind": "%s:%s" % (webhost, webport),
+            "workers": args.workers,
+            "worker_class": "gthread",
+            "threads": args.threads,
+            "backlog": args.backlog,
+            "keepalive": args.keepalive,
+            "timeout": args.requesttimeout,
+            "graceful_timeout": args.gracefultimeout
+        }
+        if args.preloadmodels:
+            options["post_fork"] = lambda server, worker: ModelPreloader.modelPreloader.start()
+        print("Serving on %s with %d workers x %d threads" % (options["bind"], args.workers, args.threads))
+        server = PreforkServer(wsgifunc, options)
+        server.run()
+        return server
+
+
+class PreforkServer(BaseApplication):
+    """
+    Minimal gunicorn application serving a given WSGI function
+    """
+    def __init__(self, wsgifunc, options):
+        self.wsgifunc = wsgifunc
+        self.options = options
+        super(PreforkServer, self).__init__()
+
+    def load_config(self):
+        for key in self.options:
+            self.cfg.set(key, self.options[key])
 
+    def load(self):
+        return self.wsgifunc
 
-# Function to make MongoDBAPI object
+
+
+# Function to make MongoDBAPI object. The MongoClient behind it is pooled, so this is cheap.
 def makeObject(link=link, dbName = "ChariotCloudDB", dbCollection="ChariotCloudTable"):
     mdbobject = MongoDBDriver.MongoDBAPI(link, user, password, authdb)
     mdbobject.defineDB(dbName)
     mdbobject.defineCollection(dbCollection)
     return mdbobject
 
+# Function to read the optional filter and time window of a read request
+def readFindArguments(result):
+    """
+    Reads "filter", "timestamp", "from" and "to" of a request
+    :return: keyword arguments for MongoDBAPI.findRecord
+    """
+    findArguments = {
+        "findQuery": result.get("filter", {}),
+        "timeField": str(result.get("timestamp", "timestamp")),
+        "fromTime": result.get("from"),
+        "toTime": result.get("to")
+    }
+    if not isinstance(findArguments["findQuery"], dict):
+        raise ValueError("filter must be a JSON object")
+    return findArguments
+
+# Function to convert a DataFrame to records that can be inserted directly (no JSON string round trip)
+def frameToRecords(df):
+    """
+    :return: list of dicts with native python values, NaN is stored as None (null)
+    """
+    columns = [str(col) for col in df.columns]
+    values = []
+    for col in df.columns:
+        values.append([None if (isinstance(v, float) and v != v) else v for v in df[col].tolist()])
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+# Function to store a csv file chunk by chunk with constant memory
+def insertCSVChunks(mdbobject, reader, prepareChunk, name):
+    """
+    Inserts the chunks of a pandas csv reader one after the other with unordered bulk inserts
+    :param reader: iterator of DataFrames (pd.read_csv with chunksize)
+    :param prepareChunk: function(df, chunk_number) returning the DataFrame to store
+    :param name: name for the progress output
+    :return: (success, number of stored rows)
+    """
+    success = True
+    rows = 0
+    for chunk_number, df in enumerate(reader):
+        df = prepareChunk(df, chunk_number)
+        if len(df) == 0:
+            continue
+        if mdbobject.insertRecords(frameToRecords(df), ordered = False) == False:
+            success = False
+        rows += len(df)
+        print("%s: chunk %d stored, %d rows so far" % (name, chunk_number, rows))
+    return success, rows
+
 class GetTableData(object):
     """
     Gets data from a table / collection. Returns data if found. Otherwise, returns an error.
@@ -140,6 +358,12 @@ class GetTableData(object):
         """
         Get Table / Collection from given table name
 
+        Optional fields of the request:
+            "properties": ["velocity","power_in"]   # Only return these columns
+            "from": 1582204815849, "to": 1582204816849      # Only return records in this time window (inclusive)
+            "timestamp": "timestamp"                # Name of the time field, "timestamp" by default
+            "filter": {"motor_id": 0}               # MongoDB filter
+
         GET function
         @return: All information about the querry
         """
@@ -166,8 +390,9 @@ class GetTableData(object):
 
             maskquery = {'_id' :0}                          # Don't return Default _IDs
 
-            # Returns a python list of all the collection
-            res = mdbobject.findRecord(maskingquery=maskquery)
+            # Returns a python list of all the collection (restricted to the requested columns and window)
+            res = mdbobject.findRecord(maskingquery=maskquery, properties=result.get("properties"),
+                                       **readFindArguments(result))
 
             jsonData = json.dumps(res)
             return jsonData
@@ -180,6 +405,156 @@ class GetTableData(object):
             print("GetTableData Finished")
             print("-----------------------------------")
 
+class StreamTableData(object):
+    """
+    Streams data of a table / collection in pages. The records are read from a cursor batch by batch and
+    written to the response as they come, so the memory use does not depend on the table size.
+
+    Example request: (* fields are optional)
+    {
+        "table": "raw_velocitypower_in_123456",
+    *   "database": "predictive_maintenance",
+    *   "properties": ["velocity", "power_in"],   # Only return these fields (and _id).
+    *   "limit": 10000,                 # Maximum number of records in this page. 0 (default) returns all.
+    *   "after": "5e8f1c...",           # Resume token (next_after of the previous page): only records after it are returned.
+    *   "after_field": "_id",           # Field the records are ordered by and resumed on. "_id" by default, e.g. "timestamp".
+    *   "batch_size": 1000,             # Records read from the database and written to the response at once.
+    *   "format": "ndjson"              # "ndjson" (default): one JSON record per line, "json": one JSON object.
+    *   "from", "to", "timestamp", "filter"     # Time window and filter as in GetTableData.
+    }
+
+    Every record carries its _id as string. If the page is full (limit reached), ndjson ends with a line
+    {"next_after": <token>} and json has "next_after": <token>. Pass the token as "after" to get the next page.
+    For after_field "_id" the token is the _id of the last record, for other fields it is the pair
+    [value of after_field, _id] of the last record, so records with the same value at a page edge are not skipped.
+    The token is MongoDB extended JSON (e.g. {"$date": ...} for datetimes), so the value keeps its type on resume.
+    """
+
+    def GET(self):
+        """
+        GET function
+        @return: generator writing the records
+        """
+
+        print("-----------------------------------")
+        print("StreamTableData Started!")
+
+        try:
+            result = json.loads(web.data().decode('utf-8'))
+
+            table = str(result["table"])
+            if "database" in result:
+                database = str(result["database"])
+            else:
+                database = "predictive_maintenance"
+
+            batch_size = int(result.get("batch_size", 1000))
+            limit = int(result.get("limit", 0))
+            after_field = str(result.get("after_field", "_id"))
+            out_format = str(result.get("format", "ndjson"))
+
+            findArguments = readFindArguments(result)
+
+            if "properties" in result:
+                maskquery = {"_id": True, after_field: True}
+                for prop in result["properties"]:
+                    maskquery[prop] = True
+            else:
+                maskquery = None
+
+        except Exception as e:
+            print("Cannot read stream request. Error: " + str(e))
+            return "Cannot read stream request: " + str(e)
+
+        try:
+            mdbobject = makeObject(dbName = database,dbCollection = table)
+
+            if mdbobject.checkCollectionExists() == False:
+                print("Invalid/ Nonexistent Collection")
+                return "Invalid/ Nonexistent Collection"
+
+            query = mdbobject.buildQuery(**findArguments)
+            if result.get("after") is not None:
+                # extended JSON of the token back to BSON types (datetime, ObjectId, ...)
+                after = json_util.loads(json.dumps(result["after"]))
+                if after_field == "_id":
+                    after = {"_id": {"$gt": ObjectId(after)}}
+                elif isinstance(after, list) and len(after) == 2:
+                    # (value, _id): later values, or the same value and a later _id (the sort order)
+                    after = {"$or": [{after_field: {"$gt": after[0]}},
+                                     {after_field: after[0], "_id": {"$gt": ObjectId(after[1])}}]}
+                else:
+                    # token of a single value
+                    after = {after_field: {"$gt": after}}
+                query = {"$and": [query, after]} if query else after
+
+            sort = [(after_field, 1)]
+            if after_field != "_id":
+                sort.append(("_id", 1))
+            cursor = mdbobject.iterRecords(query, maskquery, batchSize = batch_size, limit = limit, sort = sort)
+
+        except Exception as e:
+            print("Error in StreamTableData: " + str(e))
+            return e
+
+        if out_format == "json":
+            web.header('Content-Type', 'application/json')
+        else:
+            web.header('Content-Type', 'application/x-ndjson')
+
+        return self.stream(cursor, batch_size, limit, after_field, out_format)
+
+    def stream(self, cursor, batch_size, limit, after_field, out_format):
+        """
+        Generator writing one chunk per batch of records
+        """
+        count = 0
+        last = None
+        chunk = []
+        first = True
+
+        try:
+            if out_format == "json":
+                yield '{"data": ['
+
+            for record in cursor:
+                record["_id"] = str(record["_id"])
+                if after_field == "_id":
+                    last = record["_id"]
+                else:
+                    last = [record.get(after_field), record["_id"]]
+                chunk.append(json.dumps(record, default=str))
+                count += 1
+
+                if len(chunk) == batch_size:
+                    yield self.joinChunk(chunk, out_format, first)
+                    first = False
+                    chunk = []
+
+            if chunk:
+                yield self.joinChunk(chunk, out_format, first)
+
+            next_after = None
+            if limit > 0 and count == limit:
+                next_after = last
+
+            if out_format == "json":
+                yield '], "next_after": %s}' % json_util.dumps(next_after)
+            elif next_after is not None:
+                yield json_util.dumps({"next_after": next_after}) + "\n"
+
+        finally:
+            cursor.close()
+            print("StreamTableData Finished, %d records" % count)
+            print("-----------------------------------")
+
+    def joinChunk(self, chunk, out_format, first):
+        if out_format == "json":
+            if first:
+                return ",".join(chunk)
+            return "," + ",".join(chunk)
+        return "\n".join(chunk) + "\n"
+
 class GetTableDataByID(object):
     """
     Gets data from a table / collection. By ID. Returns data if found, otherwise, none.
@@ -193,6 +568,8 @@ class GetTableDataByID(object):
         """
         Get Table / Collection from given table name
 
+        Accepts the optional "properties", "from", "to", "timestamp" and "filter" fields of GetTableData.
+
         GET function
         @type web: string
         @param web: Tablename / Collection Name
@@ -229,12 +606,13 @@ class GetTableDataByID(object):
                 print("Invalid/ Nonexistent Collection")
                 return "Invalid/ Nonexistent Collection"
 
-            query = {}
+            findArguments = readFindArguments(result)
+            query = findArguments.pop("findQuery")
             query[idname] = id
             maskquery = {'_id' :0}
 
             # Returns a python list of all entries where id is given
-            res = mdbobject.findRecord(query,maskquery)
+            res = mdbobject.findRecord(query,maskquery, properties=result.get("properties"), **findArguments)
 
             jsonData = json.dumps(res)
             return jsonData
@@ -312,6 +690,8 @@ class CopyCSVInTable(object):
         """
         POST this is the POST function of the CopyCSVInTable
         You either have to define header names in the csv, or give column_names in the request.
+        The file is read and stored in chunks of "chunksize" rows (10000 by default).
+        With "idname" (and optionally "timestamp") the standard indexes of the table are created.
         """
 
         print("-----------------------------------")
@@ -352,6 +732,12 @@ class CopyCSVInTable(object):
             else:
                 staticColFlag = False
 
+            chunksize = int(result.get("chunksize", 10000))
+
+            # Id and time fields of the indexes of the table, no indexes are created without an idname
+            idname = str(result["idname"]) if "idname" in result else None
+            timestampname = str(result.get("timestamp", "timestamp"))
+
         except Exception as e:
             print("Cannot read table name and text file path. Error: "+ str(e))
             return e
@@ -370,33 +756,36 @@ class CopyCSVInTable(object):
             print("An error occured: " + str(e))
             return e
 
+        def prepareChunk(df, chunk_number):
+            if staticColFlag is True:
+                try:
+                    # df.assign(**static_col)           # This cool function does not work below python 3.6  So we resort to other methods
+                    for key in static_col:
+                        df[key] = static_col[key]
+                except Exception as e:
+                    print("Error in assigning static columns: " + str(e))
+
+            if addIndexFlag is True:
+                try:
+                    # The index of the chunks continues over the whole file
+                    df[index_name] = df.index
+                except Exception as e:
+                    print("Error in assigning index " + str(e))
+            return df
+
         try:
             with open(path, 'r') as f:
                 if (nameFlag == True):
-                    df = pd.read_csv(f, names=col_list)
+                    reader = pd.read_csv(f, names=col_list, chunksize=chunksize)
                 else:
-                    df = pd.read_csv(f)
-
-                if staticColFlag is True:
-                    try:
-                        # df.assign(**static_col)           # This cool function does not work below python 3.6  So we resort to other methods
-                        for key in static_col:
-                            df[key] = static_col[key]
-                    except Exception as e:
-                        print("Error in assigning static columns: " + str(e))
-
-                if addIndexFlag is True:
-                    try:
-                        df[index_name] = df.index
-                    except Exception as e:
-                        print("Error in assigning index " + str(e))
-
-                data_json = json.loads(df.to_json(orient='records'))
+                    reader = pd.read_csv(f, chunksize=chunksize)
 
-                success = mdbobject.insertRecords(data_json)
+                success, rows = insertCSVChunks(mdbobject, reader, prepareChunk, "CopyCSVInTable")
+                if idname is not None:
+                    mdbobject.ensureIndexes(idname, timestampname)
 
             if success == True:
-                return "Store data from %s in table %s successful." % (path, table)
+                return "Store data (%d rows) from %s in table %s successful." % (rows, path, table)
             else:
                 return "Store data from %s in table %s unsuccessful." % (path, table)
 
@@ -422,6 +811,7 @@ class CopyCSVToMLDB(object):
     def POST(self):
         """
         You either have to define header names in the csv, or give column_names in the request.
+        The file is read and stored in chunks of "chunksize" rows (10000 by default).
         """
 
         print("-----------------------------------")
@@ -460,30 +850,35 @@ class CopyCSVToMLDB(object):
             else:
                 idname = "ID"
 
+            chunksize = int(result.get("chunksize", 10000))
+
         except Exception as e:
             print("Cannot read csv file path. Error: "+ str(e))
             return e
 
-        # reading from the CSV and writing to df object
+        # Opening the CSV before the table is dropped
         try:
-            with open(path, 'r') as f:
-                df = pd.read_csv(f)
-                df = df[1:]
-                # Set Timestamp as index
-                #df.drop_duplicates(inplace = True)
-                if timestampname in df.columns:
-                    df.set_index(timestampname, inplace= True)
-                # Iterate over all the colunmns in df
-                for col_name in df.columns:
-                    if nameFlag and not (col_name in col_list):
-                        del df[col_name]
+            f = open(path, 'r')
+            reader = pd.read_csv(f, chunksize=chunksize)
 
         except Exception as e:
             err = "Error reading and serializing CSV data: "+ str(e)
             print(err)
             return err
 
-        df = df.dropna()
+        def prepareChunk(df, chunk_number):
+            if chunk_number == 0:
+                df = df[1:]
+            #df.drop_duplicates(inplace = True)
+            # Iterate over all the colunmns in df. The timestamp is kept so that reads can use a time window.
+            for col_name in df.columns:
+                if nameFlag and not (col_name in col_list) and col_name != timestampname:
+                    del df[col_name]
+
+            df = df.dropna()
+            # Every row carries the device ID so that the (deviceID, timestamp) index can be used
+            df[idname] = deviceID
+            return df
 
         # Creating a table under MLDB
         try:
@@ -494,15 +889,16 @@ class CopyCSVToMLDB(object):
                 mdbobject.dropCollection()
 
         except Exception as e:
+            f.close()
             print("Error in creating new collection: "+ str(e))
             return e
 
-        # writing the df object into the MLDB table
+        # writing the csv chunks into the MLDB table
         try:
-            data_json = json.loads(df.to_json(orient='records'))
-            success = mdbobject.insertRecords(data_json)
+            success, rows = insertCSVChunks(mdbobject, reader, prepareChunk, "CopyCSVToMLDB")
+            mdbobject.ensureIndexes(idname, timestampname)
             if success == True:
-                return "Store data from %s in table %s successful." % (path, table)
+                return "Store data (%d rows) from %s in table %s successful." % (rows, path, table)
             else:
                 return "Store data from %s in table %s unsuccessful." % (path, table)
 
@@ -511,9 +907,9 @@ class CopyCSVToMLDB(object):
             return e
 
         finally:
+            f.close()
             print("CopyCSVToMLDB finished!")
             print("-----------------------------------")
-            return success
 
 
 class WriteInTable(object):
@@ -538,6 +934,9 @@ class WriteInTable(object):
 
     If you want to directly add an entry without list, use WriteOneRowInTable API
 
+    Optional "idname" (and "timestamp") of the table: the standard indexes of raw_/results_/model tables
+    are created on these fields, see MongoDBDriver.IndexManager. Without "idname" no indexes are created.
+
     @author: Shreyas Gokhale
     @contact: s.gokhale@campus.tu-berlin.de
     """
@@ -562,6 +961,9 @@ class WriteInTable(object):
 
             data  =  result["data"]
 
+            idname = str(result["idname"]) if "idname" in result else None
+            timestampname = str(result.get("timestamp", "timestamp"))
+
         except Exception as e:
             print("Cannot read table name and data. Error: "+ str(e))
             return e
@@ -577,6 +979,8 @@ class WriteInTable(object):
 
         try:
             success = mdbobject.insertRecords(data)
+            if idname is not None:
+                mdbobject.ensureIndexes(idname, timestampname)
 
             if success == True:
                 return "Store data in table %s successful."%( table)
@@ -607,6 +1011,8 @@ class WriteOneRowInTable(object):
     "indices" = ["name","age"]
     "values" = ["Red",6]
 
+    Optional "idname" (and "timestamp") of the table, see WriteInTable.
+
     @author: Shreyas Gokhale
     @contact: s.gokhale@campus.tu-berlin.de
     """
@@ -644,6 +1050,8 @@ class WriteOneRowInTable(object):
             else:
                 data  =  result["data"]
 
+            idname = str(result["idname"]) if "idname" in result else None
+            timestampname = str(result.get("timestamp", "timestamp"))
 
         except Exception as e:
             print("Cannot read table name and data. Error: "+ str(e))
@@ -660,6 +1068,8 @@ class WriteOneRowInTable(object):
 
         try:
             success = mdbobject.insertOneRecord(data)
+            if idname is not None:
+                mdbobject.ensureIndexes(idname, timestampname)
 
             if success == True:
                 return "Store data in table %s successful." % (table)
@@ -813,6 +1223,99 @@ class DeleteDatabase(object):
             print("-----------------------------------")
 
 
+class TableIndexes(object):
+    """
+    Lists, creates and drops the indexes of a table / collection.
+
+    GET: {"table": "raw_velocitypower_in_123456", * "database": "predictive_maintenance"}
+    Returns the indexes and how often each one was used since the server start.
+
+    POST examples:
+    {"table": ..., "action": "ensure", "idname": "deviceID", * "timestamp": "timestamp"}   # Standard indexes of the table
+    {"table": ..., "action": "create", "keys": [["deviceID", 1], ["timestamp", -1]], * "name": ..., * "unique": false}
+    {"table": ..., "action": "drop", "name": "deviceID_1_timestamp_1"}
+    """
+
+    def readRequest(self):
+        result = json.loads(web.data().decode('utf-8'))
+        table = str(result["table"])
+        if "database" in result:
+            database = str(result["database"])
+        else:
+            database = "predictive_maintenance"
+        return result, makeObject(dbName = database, dbCollection = table)
+
+    def GET(self):
+        print("-----------------------------------")
+        print("TableIndexes Started!")
+        try:
+            result, mdbobject = self.readRequest()
+
+            if mdbobject.checkCollectionExists() == False:
+                return "Invalid/ Nonexistent Collection"
+
+            indexes = mdbobject.listIndexes()
+            try:
+                usage = mdbobject.indexUsage()
+            except Exception as e:
+                print("Index usage not available: " + str(e))
+                usage = {}
+            for index in indexes:
+                index["ops"] = usage.get(index["name"])
+
+            return json.dumps(indexes, default=str)
+
+        except Exception as e:
+            print("Error in TableIndexes: " + str(e))
+            return e
+
+        finally:
+            print("TableIndexes Finished")
+            print("-----------------------------------")
+
+    def POST(self):
+        print("-----------------------------------")
+        print("TableIndexes Started!")
+        try:
+            result, mdbobject = self.readRequest()
+            action = result["action"]
+
+            if action == "ensure":
+                if "idname" not in result:
+                    return "Missing idname (id field of the table) for action ensure"
+                names = mdbobject.ensureIndexes(str(result["idname"]), str(result.get("timestamp", "timestamp")))
+                return json.dumps(names)
+            elif action == "create":
+                name = mdbobject.createIndex(result["keys"], result.get("name"), bool(result.get("unique", False)))
+                return json.dumps(name)
+            elif action == "drop":
+                mdbobject.dropIndex(result["name"])
+                return "Index %s dropped" % result["name"]
+            else:
+                return "Unknown action %s (use ensure, create or drop)" % action
+
+        except Exception as e:
+            print("Error in TableIndexes: " + str(e))
+            return e
+
+        finally:
+            print("TableIndexes Finished")
+            print("-----------------------------------")
+
+
+class PoolStats(object):
+    """
+    Returns the MongoDB connection pool statistics (clients, cached handles, checkouts)
+    """
+    def GET(self):
+        try:
+            return json.dumps(MongoDBDriver.clientRegistry.stats())
+
+        except Exception as e:
+            print("Error in PoolStats: " + str(e))
+            return e
+
+
 class MDBSetRecords(object):
     def POST(self):
         try:
@@ -867,3 +1370,6 @@ if __name__ == '__main__':
 
     except Exception as e:
         print("Cannot start DataBaseAPIServer: " + str(e))
+
+    finally:
+        MongoDBDriver.clientRegistry.closeAll()
@@ -9,10 +9,11 @@ import os
 import re
 import threading
 import sys
+import queue
+import time
 import joblib
 
 import csv
-import requests
 import web
 import json
 import urllib
@@ -27,16 +28,166 @@ import jsonpickle
 import seaborn as sns
 
 from GeneticAlgorithmControl import GeneticAlgorithmControl
-from ChariotCloudAPI import WebServer
+import MLDataAccess
+import JobQueue
+import ModelStore
+from ModelCache import modelCache
+from MicroBatcher import predictBatcher
+from ResultSmoothing import resultSmoother
+import ModelPreloader
+import HyperparameterSearch
 
 from PMmodels.ocsvm import OCSVM
 from PMmodels.knn import KNN
 from PMmodels.kpca import KPCA
 
-pm_result_list = []
 
-server = WebServer()
-link = 'http://' + server.weblink
+def loadModel(database, model_table, idname, deviceID, modelID = None, return_id = False):
+    """
+    Returns the deserialized model (dict with clf and intermediate variables) of a device.
+    Models are taken from the model cache, and loaded from the database and cached on a miss.
+    The cache key is the _id of the model record, which is looked up first, so a model trained by another
+    worker process (prefork mode) is never served stale.
+    KNN models saved without a threshold are upgraded and stored again once.
+    :param modelID: index of the saved model, None for the latest one
+    :param return_id: also return the _id (string) of the model record, which identifies the loaded model
+    :return: model dict, None if no model was found (and the record _id if return_id)
+    """
+    recordID = MLDataAccess.getModelRecordID(database, model_table, idname, deviceID, modelID)
+    if recordID is None:
+        return (None, None) if return_id else None
+    key = str(recordID)
+
+    pickledDict = modelCache.get(database, model_table, key)
+    if pickledDict is not None:
+        return (pickledDict, key) if return_id else pickledDict
+
+    record = MLDataAccess.getModelRecordByRecordID(database, model_table, recordID)
+    if record is None:
+        return (None, None) if return_id else None
+
+    pickledDict = ModelStore.loadModel(database, record)
+    if record.get("algorithm") == "KNN" and 'threshold' not in pickledDict:
+        KNN().upgrade(pickledDict)
+        upgraded = ModelStore.replaceModel(database, model_table, recordID, record, pickledDict)
+        if upgraded is not None:
+            print("KNN model %s of %s upgraded" % (key, model_table))
+            record = upgraded
+
+    modelCache.put(database, model_table, key, pickledDict, ModelStore.modelSize(record))
+    return (pickledDict, key) if return_id else pickledDict
+
+
+def predictModel(algorithm, pickledDict, data, return_scores = False):
+    """
+    Predicts the rows of data with a loaded model
+    :param data: 2D array or DataFrame of the model properties
+    :param return_scores: also return the anomaly scores, the reconstruction errors of KPCA (None for the
+                          other algorithms)
+    :return: array of results, 1 for normal data (-1 or 0 for anomalies depending on the algorithm)
+             (and the scores if return_scores)
+    """
+    model = getattr(sys.modules[__name__], algorithm)()
+
+    scores = None
+    if algorithm == 'OCSVM':
+        labels = model.predict(pickledDict['clf'], data)
+    elif algorithm == 'KNN':
+        labels = model.predict(pickledDict['clf'], pickledDict['out_var'], data,
+                               pickledDict['threshold'], pickledDict['method'])
+    elif algorithm == 'KPCA':
+        if return_scores:
+            labels, scores = model.predict(pickledDict['clf'], pickledDict['scaler'], pickledDict['out_var'], data,
+                                           return_scores = True)
+        else:
+            labels = model.predict(pickledDict['clf'], pickledDict['scaler'], pickledDict['out_var'], data)
+
+    if return_scores:
+        return labels, scores
+    return labels
+
+
+def predictRows(algorithm, pickledDict, data):
+    """
+    Predicts the rows of data, for the micro-batcher
+    :return: list of (result, score) per row, score None for algorithms without scores
+    """
+    labels, scores = predictModel(algorithm, pickledDict, data, return_scores = True)
+    if scores is None:
+        scores = [None] * len(labels)
+    return list(zip(labels, scores))
+
+
+def fitModel(algorithm, data, para_arr, options = {}):
+    """
+    Fits a model
+    :param options: train request, read for the optional training fields of the algorithm
+    :return: the model object and the model dict (clf and intermediate variables) to be saved
+    """
+    if algorithm == 'OCSVM' or algorithm == 'KNN' or algorithm == 'KPCA':
+        model = getattr(sys.modules[__name__], algorithm)()
+    else:
+        raise Exception("Input algorithm not supported (Only supports OCSVM, KNN or KPCA).")
+
+    pickledDict = {}
+    if algorithm == 'OCSVM':
+        if "max_rows" in options:
+            model.max_rows = int(options["max_rows"])
+        if "sampling" in options:
+            model.sampling = options["sampling"]
+        if "solver" in options:
+            model.solver = options["solver"]
+        if "n_landmarks" in options:
+            model.n_landmarks = int(options["n_landmarks"])
+        clf = model.fit(data, para_arr[0], para_arr[1])
+    else:
+        if algorithm == 'KNN':
+            clf, out_var = model.fit(data, para_arr[0], para_arr[1])
+            # Stored so that predictions do not have to recalculate them
+            pickledDict['decision_scores'] = model.decision_scores_
+            pickledDict['threshold'] = model.threshold_
+            pickledDict['method'] = model.method
+        elif algorithm == 'KPCA':
+            # para: [alpha, gamma] or [alpha, gamma, n_landmarks, approximation] for the approximate KPCA
+            clf, scaler, out_var = model.fit(data, *para_arr[:4])
+            pickledDict['scaler'] = scaler
+
+        pickledDict['out_var'] = out_var
+
+    pickledDict['clf'] = clf
+    return model, pickledDict
+
+
+def storeModel(database, table, algorithm, properties, para_arr, deviceID, rows, model, pickledDict, compress = 3,
+               extra = None):
+    """
+    Saves a fitted model in its model table
+    :param table: table the model was trained on
+    :param rows: number of training rows
+    :param extra: further fields of the metadata record
+    :return: the metadata record, None if saving failed
+    """
+    model_table = MLDataAccess.modelTableName(algorithm, properties, para_arr, deviceID)
+    model_data = {
+        "algorithm": algorithm,
+        "para": para_arr,
+        "properties": properties,
+        "table": table,
+        "database":database,
+        "rows": rows,
+        "deviceID": deviceID
+    }
+    # rows used, fit time and support vectors of the OCSVM
+    model_data.update(getattr(model, "fit_info_", {}))
+    if extra:
+        model_data.update(extra)
+
+    # The model itself goes to GridFS, the model table gets its metadata
+    record = ModelStore.saveModel(database, model_table, pickledDict, model_data, compress)
+    if record is not None:
+        # Predictions have to use the new model
+        modelCache.invalidate(database, model_table)
+    return record
 
 
 class GenericTrain(object):
@@ -59,17 +210,52 @@ class GenericTrain(object):
             "para" :[0.01,0.5],         # Parameters for ML algorithm
             "properties" : ["velocity","power_in"],   # What columns from the data you want for training
         *   "database" : "predictive_maintenance" # If you want to save table in a specific database. It is "Generic" by default.
+        *   "from" : 1582204815849, "to" : 1582204816849  # Only train on this time window of the data
+        *   "timestamp" : "timestamp"             # Name of the time field of the data
+        *   "filter" : {"motor_id" : 0}           # Only train on records matching this MongoDB filter
+        *   "async" : true                        # Train in the background. Returns {"job_id": ...} immediately,
+                                                  # the status is available under /cloud/ml/jobs/status/
+        *   "compress" : 3                        # zlib level (0-9) of the stored model, 0 stores it uncompressed
+        *   "max_rows" : 10000                    # OCSVM: subsample larger tables to this number of rows
+        *   "sampling" : "time"                   # OCSVM: subsampling "time" (evenly spaced), "stratified" or "random"
+        *   "solver" : "libsvm"                   # OCSVM: "libsvm" or "sgd" (approximate kernel, linear in the rows)
+        *   "n_landmarks" : 300                   # OCSVM: number of kernel features of the "sgd" solver
         }
         # TODO: Combining multiple IDs for one training.
 
         @rtype: string
         @return: error type or successful reminder
         """
+        try:
+            result = json.loads(web.data().decode('utf-8'))
+
+        except Exception as e:
+            print("Error occurred when reading data from post: " + str(e))
+            return e
+
+        if result.get("async", False):
+            try:
+                job = JobQueue.trainingJobs.submit("train", self.train, result)
+            except queue.Full:
+                return "Training queue is full, try again later."
+            print("GenericTrain job %s queued" % job.id)
+            return json.dumps({"job_id": job.id, "status": job.status})
+
+        return self.train(result)
+
+    def train(self, result, progress = None):
+        """
+        Trains and saves a model for the given request
+        :param progress: optional function(fraction, stage) to report the progress
+        @return: error type or successful reminder
+        """
+        if progress is None:
+            progress = lambda fraction, stage = None: None
+
         print("-----------------------------------")
         print("GenericTrain Started")
 
         try:
-            result = json.loads(web.data().decode('utf-8'))
             algorithm = result["algorithm"]
             deviceID = str(result["deviceID"])
 
@@ -84,10 +270,7 @@ class GenericTrain(object):
             para_arr = result["para"]
 
             # Table Name
-            property_id = ""
-            for property_key in properties:
-                property_id = property_id + str(property_key)
-            table = "raw" + "_" + property_id +  "_" + deviceID
+            table = MLDataAccess.rawTableName(properties, deviceID)
             #table = result["table"]
 
             if "resulttable" in result:
@@ -103,19 +286,11 @@ class GenericTrain(object):
 
         # Get Data from the columns mentioned in the request
         try:
-            # Creating query in python dict
-            req = {
-                'table': table,
-                'database': database
-            }
-
-            # This is commented out as csv has all the IDs 0. So for now, just get the data using table name.
-            # data_response = requests.get(link + '/cloud/db/getTableDataByID/', data=json.dumps(req))
-
-            data_response = requests.get(link + '/cloud/db/getTableData/', data=json.dumps(req))
-            data_response = data_response.json()  # We get data in string, convert in json/dict.
-            data_response = pd.DataFrame(data_response)  # Convert to pandas df
-            data = data_response[result["properties"]]  # Select columns matching the request
+            progress(0.05, "fetching data")
+            # Only the columns given in properties and the rows in the requested window are fetched.
+            data = MLDataAccess.getTableFrame(database, table, properties, **MLDataAccess.readWindow(result))
+            if data is None:
+                return "Table %s not found, store your data first!" % table
 
         except Exception as e:
             print("Error in fetching data from the database: " + str(e))
@@ -124,60 +299,280 @@ class GenericTrain(object):
 
         # Train model
         try:
-            if algorithm == 'OCSVM' or algorithm == 'KNN' or algorithm == 'KPCA':
-                model = getattr(sys.modules[__name__], algorithm)()
-            else:
-                raise Exception("Input algorithm not supported (Only supports OCSVM, KNN or KPCA).")
+            progress(0.2, "training")
+            model, pickledDict = fitModel(algorithm, data, para_arr, result)
 
-            pickledDict = {}
-            if algorithm == 'OCSVM':
-                clf = model.fit(data, para_arr[0], para_arr[1])
-            else:
-                if algorithm == 'KNN':
-                    clf, out_var = model.fit(data, para_arr[0], para_arr[1])
-                elif algorithm == 'KPCA':
-                    clf, scaler, out_var = model.fit(data, para_arr[0], para_arr[1])
-                    pickledDict['scaler'] = scaler
+        except Exception as e:
+            print("Error occurred during model training: " + str(e))
+            return e
 
-                pickledDict['out_var'] = out_var
+        try:
+            progress(0.9, "saving")
+            print("Model saving")
 
-            pickledDict['clf'] = clf
+            if storeModel(database, table, algorithm, properties, para_arr, deviceID, len(data), model, pickledDict,
+                          int(result.get("compress", 3))) is None:
+                return 'Saving %s model unsuccessful.' % algorithm
+
+            # rows used, fit time and support vectors of the OCSVM
+            fit_info = getattr(model, "fit_info_", {})
+            message = '%s model trained.' % algorithm
+            if fit_info:
+                message += ' Fit on %d of %d rows in %.2f s, %d support vectors.' % (
+                    fit_info["rows_used"], fit_info["rows"], fit_info["fit_time"], fit_info["n_support"])
+            print(message)
+            return message
 
         except Exception as e:
-            print("Error occurred during model training: " + str(e))
+            print("Error occurred during model saving: " + str(e))
+            return e
+
+        finally:
+            print("GenericTrain function finished!")
+            print("-----------------------------------")
+
+
+class GenericTrainSearch(object):
+    """
+    Hyperparameter search: evaluates many "para" candidates of an algorithm on the data of a device in
+    parallel, and saves only the best model (fitted on all data) with a leaderboard of the candidates.
+    See HyperparameterSearch for the scoring.
+    """
+
+    def POST(self):
+        """
+        Example of request: (* fields are optional)
+        {
+            "algorithm" : "OCSVM",
+            "deviceID" : "123456",
+            "properties" : ["velocity","power_in"],
+            "grid" : [[0.01, 0.05, 0.1], [0.1, 0.5, 1, 4]]   # Values of each para position, all combinations
+                                                            # are evaluated. OR
+            "candidates" : [[0.01, 0.5], [0.05, 1]]         # the para arrays to evaluate
+        *   "n_iter" : 10                         # Random search: evaluate 10 combinations drawn from the grid
+        *   "validation" : 0.2                    # Fraction of the data held out for scoring
+        *   "workers" : 4                         # Number of candidates evaluated at the same time
+        *   "backend" : "thread"                  # "thread" or "process" (spawned processes) pool
+        *   "database", "from", "to", "timestamp", "filter", "async", "compress" and the OCSVM
+            training fields as for GenericTrain
+        }
+
+        @rtype: string
+        @return: JSON with the best para and the leaderboard, or error
+        """
+        try:
+            result = json.loads(web.data().decode('utf-8'))
+
+        except Exception as e:
+            print("Error occurred when reading data from post: " + str(e))
             return e
 
+        if result.get("async", False):
+            try:
+                job = JobQueue.trainingJobs.submit("search", self.search, result)
+            except queue.Full:
+                return "Training queue is full, try again later."
+            print("GenericTrainSearch job %s queued" % job.id)
+            return json.dumps({"job_id": job.id, "status": job.status})
+
+        res = self.search(result)
+        return res if isinstance(res, Exception) else json.dumps(res)
+
+    def search(self, result, progress = None):
+        """
+        Runs the search for the given request and saves the best model
+        :param progress: optional function(fraction, stage) to report the progress
+        :return: dict with the best para and the leaderboard, or error
+        """
+        if progress is None:
+            progress = lambda fraction, stage = None: None
+
+        print("-----------------------------------")
+        print("GenericTrainSearch Started")
+
         try:
-            print("Model saving")
+            algorithm = result["algorithm"]
+            deviceID = str(result["deviceID"])
+            properties = result["properties"]
 
-            payload = {}
-            payload["table"] = str(algorithm) + "_model_" + property_id + "_" + str(para_arr[0]) + "_" + str(para_arr[1]) + "_" + deviceID
-            payload["database"] = database
-            payload["data"] = {
-                "clf": str(pickle.dumps(clf)),
-                "algorithm": algorithm,
-                "table": table,
-                "database":database,
-                "model": jsonpickle.encode(pickledDict),
-                "deviceID": deviceID
-            }
+            if "database" in result:
+                database = result["database"]
+            else:
+                database = "predictive_maintenance"
+
+            cands = HyperparameterSearch.candidates(result.get("grid"), result.get("candidates"),
+                                                    int(result.get("n_iter", 0)))
+            if len(cands) == 0:
+                return Exception("No candidates given, set grid or candidates.")
 
-            payload["id"] = deviceID
+            table = MLDataAccess.rawTableName(properties, deviceID)
 
-            data = requests.post(link + '/cloud/db/writeOneRowInTable/', data=json.dumps(payload))
+        except Exception as e:
+            print("Error occurred when reading data from post: " + str(e))
+            return e
 
-            print('%s model trained.' % algorithm)
-            return '%s model trained.' % algorithm
+        try:
+            # The data is fetched once for all candidates
+            progress(0.05, "fetching data")
+            data = MLDataAccess.getTableFrame(database, table, properties, **MLDataAccess.readWindow(result))
+            if data is None:
+                return Exception("Table %s not found, store your data first!" % table)
+            data = data.dropna()
+
+            start = time.time()
+            leaderboard = HyperparameterSearch.search(
+                algorithm, data.values, cands, result,
+                validation = float(result.get("validation", 0.2)),
+                workers = int(result.get("workers", 4)),
+                backend = result.get("backend", "thread"),
+                progress = lambda fraction: progress(0.1 + 0.7 * fraction, "searching"))
+            search_time = time.time() - start
+
+            best = leaderboard[0]
+            if best["score"] is None:
+                return Exception("All candidates failed, first error: " + best["error"])
+
+            # The best candidate is fitted again on all data
+            progress(0.8, "training best model")
+            model, pickledDict = fitModel(algorithm, data, best["para"], result)
+
+            progress(0.9, "saving")
+            record = storeModel(database, table, algorithm, properties, best["para"], deviceID, len(data), model,
+                                pickledDict, int(result.get("compress", 3)),
+                                {"search": {"leaderboard": leaderboard, "search_time": search_time}})
+            if record is None:
+                return Exception('Saving %s model unsuccessful.' % algorithm)
+
+            print("Best %s para %s (score %.3f) of %d candidates in %.2f s" %
+                  (algorithm, best["para"], best["score"], len(leaderboard), search_time))
+            return {
+                "algorithm": algorithm,
+                "best_para": best["para"],
+                "best_score": best["score"],
+                "candidates": len(leaderboard),
+                "search_time": search_time,
+                "leaderboard": leaderboard
+            }
 
         except Exception as e:
-            print("Error occurred during model saving: " + str(e))
+            print("Error occurred during the hyperparameter search: " + str(e))
             return e
 
         finally:
-            print("GenericTrain function finished!")
+            print("GenericTrainSearch function finished!")
             print("-----------------------------------")
 
 
+class ModelCacheStats(object):
+    """
+    GET: size, hit / miss / eviction counters of the model cache. POST: clears the cache.
+    """
+
+    def GET(self):
+        return json.dumps(modelCache.stats())
+
+    def POST(self):
+        modelCache.clear()
+        return "Model cache cleared"
+
+
+class ModelPreload(object):
+    """
+    GET: status of the model preloading. POST: preloads the latest models into the model cache.
+
+    Example request: (* fields are optional)
+    {
+    *   "databases" : ["predictive_maintenance"]   # Databases searched for model tables, --preload-databases by default
+    *   "workers" : 4                               # Number of models loaded at the same time
+    *   "idname" : "deviceID"                       # Id field of the model records, --preload-idname by default
+    *   "wait" : true                               # Return after the preloading finished
+    }
+    """
+
+    def GET(self):
+        return json.dumps(ModelPreloader.modelPreloader.stats())
+
+    def POST(self):
+        try:
+            data = web.data()
+            result = json.loads(data.decode('utf-8')) if data else {}
+            databases = result.get("databases")
+            workers = result.get("workers")
+            idname = result.get("idname")
+
+            if not ModelPreloader.modelPreloader.start(databases, workers, idname):
+                return "Model preloading is already running"
+            if result.get("wait", False):
+                ModelPreloader.modelPreloader.wait()
+            return json.dumps(ModelPreloader.modelPreloader.stats())
+
+        except Exception as e:
+            print("Error in ModelPreload: " + str(e))
+            return e
+
+
+class Ready(object):
+    """
+    Readiness check: 200 once the model preloading finished, 503 while it is running
+    """
+
+    def GET(self):
+        stats = ModelPreloader.modelPreloader.stats()
+        if not stats["ready"]:
+            web.ctx.status = "503 Service Unavailable"
+        return json.dumps(stats)
+
+
+class PredictBatchStats(object):
+    """
+    GET: configuration and batch counters of the real-time prediction micro-batching
+    """
+
+    def GET(self):
+        return json.dumps(predictBatcher.stats())
+
+
+class JobList(object):
+    """
+    Lists the background jobs of all server processes and the queue statistics of this process
+    """
+
+    def GET(self):
+        try:
+            res = {
+                "train": JobQueue.trainingJobs.stats(),
+                "jobs": JobQueue.trainingJobs.listStatus()
+            }
+            return json.dumps(res, default=str)
+
+        except Exception as e:
+            print("Error in JobList: " + str(e))
+            return e
+
+
+class JobStatus(object):
+    """
+    Status, progress, timing and error of one background job
+
+    Example request:
+    {
+        "job_id" : "6a1f0b7e-..."       # Returned by the request that submitted the job
+    }
+    """
+
+    def GET(self):
+        try:
+            result = json.loads(web.data().decode('utf-8'))
+            status = JobQueue.trainingJobs.status(str(result["job_id"]))
+            if status is None:
+                return "Unknown job %s" % result["job_id"]
+            return json.dumps(status, default=str)
+
+        except Exception as e:
+            print("Error in JobStatus: " + str(e))
+            return e
+
+
 class GenericPredict(object):
     """
     Predictive maintenance: prediction for any generic data using the previously saved model in MongoDB database
@@ -198,6 +593,10 @@ class GenericPredict(object):
     *   "deviceID": "c3cedae8-6143-4421-84aa-32e527c6b04e", # What do you call your ID. If not provided, it is "ID" by default.
     *   "database": "predictive_maintenance"          # If you want to save table in a specific database. It is "ChariotCloud" by default.
     *   "optional_resulttable" : "nosave"   # Table Name to save results. If = "nosave", don't save - just return the results to the user.
+    *   "smoothing_window": 5               # Anomaly only if the fraction of normal results among the last 5 of the device
+    *   "smoothing_weight": 0.4             # and model is below 0.4. 1 (default) disables the smoothing.
+    *   "persist_smoothing": true           # Keep the last results in the table smoothing_state over restarts.
+    *   "from", "to", "timestamp", "filter" # Time window and filter of the table data to predict, see GenericTrain.
     }
 
     @author: Orhan Can Görür, Shreyas Gokhale
@@ -205,9 +604,9 @@ class GenericPredict(object):
     """
 
     def __init__(self):
-        global pm_result_list
         self.moving_aver_size = 1
         self.pm_weight = 0.4
+        self.persist_smoothing = False
 
     def POST(self):
         """
@@ -248,13 +647,20 @@ class GenericPredict(object):
             property_id = ""
             for property_key in cols:
                 property_id = property_id + str(property_key)
-            dataTable = "raw" + "_" + property_id + "_" + str(deviceID) # every raw data is saved with the device ID
+            dataTable = MLDataAccess.rawTableName(cols, deviceID) # every raw data is saved with the device ID
 
             if "optional_resulttable" in result:  # User wants to save in table with this specific name
                 resultTable = str(result["optional_resulttable"])  # IF resulttable is also nosave, no data will be saved in DB
             else:
                 resultTable = "results_" + property_id + "_" + str(deviceID)
 
+            if "smoothing_window" in result:  # Number of results of the device and model averaged
+                self.moving_aver_size = int(result["smoothing_window"])
+            if "smoothing_weight" in result:
+                self.pm_weight = float(result["smoothing_weight"])
+            if "persist_smoothing" in result:  # Keep the averaged results in the database over restarts
+                self.persist_smoothing = bool(result["persist_smoothing"])
+
             if "input" in result:  # User has given data values to predict. After Prediction, store values and data in saved table.
                 inputs = result["input"]
                 realTimeFlag = True  # We inplicitly know that user is sending realtime data
@@ -276,7 +682,7 @@ class GenericPredict(object):
             else:
                 sameTableUpdateFlag = False
 
-            model_table = str(algorithm) + "_model_" + property_id + "_" + str(para_arr[0]) + "_" + str(para_arr[1]) + "_" + str(deviceID)
+            model_table = MLDataAccess.modelTableName(algorithm, cols, para_arr, deviceID)
 
             if __debug__:
                 print(result)
@@ -290,16 +696,11 @@ class GenericPredict(object):
             # read in data
             try:
                 if realTimeFlag == False:  # Read the data from the table
-                    try:  # For now, this reads all the table data
-                        #
-                        req = {
-                            'database': database,
-                            'table': dataTable
-                        }
-
-                        data_response = requests.get(link + '/cloud/db/getTableData/', data=json.dumps(req))
-                        data_response = data_response.json()  # We get data in string, convert in json/dict.
-                        data_response = pd.DataFrame(data_response)  # Convert to pandas df
+                    try:  # Only the columns given in properties and the rows in the requested window are fetched.
+                        data_response = MLDataAccess.getTableFrame(database, dataTable, cols,
+                                                                   **MLDataAccess.readWindow(result))
+                        if data_response is None:
+                            return "Table %s not found, store your data first!" % dataTable
                         data = data_response[result["properties"]]  # Select columns matching the request
 
                     except Exception as e:
@@ -333,30 +734,19 @@ class GenericPredict(object):
         try:
 
             try:  # Get pretrained model from database for prediction
-                payload = {
-                    'table': model_table,
-                    'database': database,
-                    'id': str(deviceID),
-                    'idname': str(idname)
-                }
-
                 pickledDict = {}
 
                 print("Requesting Model")
-                all_model = requests.get(link + '/cloud/db/getTableDataByID/', data=json.dumps(payload))
-                all_model = all_model.json()
                 if "modelID" in result:
-                    modelID = result["modelID"]
-                    all_model = all_model[int(modelID)]
+                    modelID = int(result["modelID"])
                 else:
-                    index = len(all_model)
-                    all_model = all_model[index-1] # if not provided, take the latest saved model
+                    modelID = None  # if not provided, take the latest saved model
 
-                if all_model is False:
+                pickledDict, recordID = loadModel(database, model_table, str(idname), str(deviceID), modelID,
+                                                  return_id = True)
+                if pickledDict is None:
                     return "Matching Model Not Found, Train your data first!"
 
-                pickledDict = jsonpickle.decode(all_model['model'])
-
             except Exception as e:
                 err = "Error occurred when loading trained model and intermediate variables: " + str(e)
                 print(err)
@@ -370,19 +760,18 @@ class GenericPredict(object):
         # Step 4: Predict the data
         try:
             # model predicting
-            model = getattr(sys.modules[__name__], algorithm)()
-
-            if algorithm == 'OCSVM':
-                result = model.predict(pickledDict['clf'], data)
+            if realTimeFlag == True and predictBatcher.enabled():
+                # Predicted in one batch with concurrent requests for the same model (record), so a model
+                # saved meanwhile starts a new batch
+                label, score = predictBatcher.predict((database, model_table, recordID),
+                                                      lambda rows: predictRows(algorithm, pickledDict, rows), data[0])
+                result, scores = [label], (None if score is None else [score])
             else:
-                if algorithm == 'KNN':
-                    result = model.predict(pickledDict['clf'], pickledDict['in_var'], data)
-                elif algorithm == 'KPCA':
-                    result = model.predict(pickledDict['clf'], pickledDict['scaler'], pickledDict['in_var'], data)
+                result, scores = predictModel(algorithm, pickledDict, data, return_scores = True)
 
             # Result Modifications
             ml_result = float(result[0])
-            anomaly_detected = self.moving_average_pm(ml_result)
+            anomaly_detected = self.moving_average_pm(ml_result, database, model_table, deviceID)
 
         except Exception as e:
             err = "Error occurred while predicting: " + str(e)
@@ -394,54 +783,47 @@ class GenericPredict(object):
         try:
             if resultTable != "nosave":  # Result has to be saved in some table
                 if realTimeFlag == True:
-                    payload = {}
-                    payload["table"] = resultTable
                     rlt = {}
                     i = 0
                     for c in cols:
                         rlt[c] = inputs[i]
                         i += 1
                     rlt['result'] = int(anomaly_detected)
+                    if scores is not None:
+                        rlt['score'] = float(scores[0])
                     rlt[str(idname)] = deviceID
-                    payload["data"] = rlt
-                    payload["id"] = deviceID
-                    payload["database"] = database
 
-                    res = requests.post(link + '/cloud/db/writeOneRowInTable/', data=json.dumps(payload))
+                    res = MLDataAccess.writeOneRow(database, resultTable, rlt, str(idname))
 
-                    print('Result Saved in %s , PM is: %s' % (payload["table"], anomaly_detected))
+                    print('Result Saved in %s , PM is: %s' % (resultTable, anomaly_detected))
                     result_load = {}
                     result_load["anomaly_detected"] = int(anomaly_detected)
                     result_load["ml_result"] = ml_result
+                    if scores is not None:
+                        result_load["score"] = float(scores[0])
                     #result_load = [anomaly_detected, ml_result]
                     json_result = json.dumps(result_load)
                     return json_result
 
                 else:
                     resultdf = pd.DataFrame(result, columns=["result"])
+                    if scores is not None:
+                        resultdf["score"] = scores
 
                     resulttablename = resultTable + "_onRawData_"
                     save_response = pd.concat([data_response, resultdf], axis=1)
 
-                    payload["table"] = resulttablename
-                    payload["id"] = deviceID
+                    ret = MLDataAccess.replaceTable(database, resulttablename, save_response.to_dict(orient='records'),
+                                                    str(idname))
 
-                    payload["data"] = save_response.to_dict(orient='records')
-
-                    delete_payload = {
-                        'table': resulttablename
-
-                    }
-                    ret = requests.post(link + '/cloud/db/deleteTable/', data=json.dumps(delete_payload))
-
-                    ret = requests.post(link + '/cloud/db/writeInTable/', data=json.dumps(payload))
-
-                    print('Result Saved in %s ' % (payload["table"]))
-                    return ('Result Saved in %s' % (payload["table"]))
+                    print('Result Saved in %s ' % (resulttablename))
+                    return ('Result Saved in %s' % (resulttablename))
 
             else:
                 result_load = {}
                 result_load = [anomaly_detected, ml_result]
+                if scores is not None:
+                    result_load.append(float(scores[0]))
                 json_result = json.dumps(result_load)
                 return json_result
 
@@ -451,39 +833,154 @@ class GenericPredict(object):
             return err
 
     # Moving average function to smooth the recognition process and avoid noises and false positives/negatives
-    # The function is currently disabled by setting self.moving_aver_size to '1'. Set it back to a value to activate
-    def moving_average_pm(self, curr_result):
-        global pm_result_list
-        # by default this is set to 1. Skipping the averaging.
-        if self.moving_aver_size == 1:
-            if curr_result == 1.0:
-                anomaly_detected = False
+    # The function is disabled by default by setting self.moving_aver_size to '1'. Set "smoothing_window" to activate
+    def moving_average_pm(self, curr_result, database, model_table, deviceID):
+        # The last results are kept per device and model
+        return resultSmoother.smooth(database, model_table, deviceID, curr_result,
+                                     self.moving_aver_size, self.pm_weight, self.persist_smoothing)
+
+
+class GenericBulkPredict(object):
+    """
+    Real-time prediction of many rows, optionally of several devices, in one request.
+    The rows of each device are predicted in one vectorized call with the latest model of the device.
+    The results are saved with one bulk insert per result table.
+
+    Example request:
+    {
+    !   "algorithm" : "OCSVM",
+    !   "properties" : ["velocity","power_in"],   # The columns you trained the data for, any number
+    !   "para": [0.01, 0.5],
+    !a  "deviceID": "123456", "input": [[31.0, 1.2], [30.5, 1.1]]     # EITHER rows of one device
+    !b  "devices": {"123456": [[31.0, 1.2]], "654321": [[12.0, 0.4], [12.5, 0.5]]}  # OR rows per device
+    *   "idname": "deviceID"
+    *   "database": "predictive_maintenance"
+    *   "modelID": 0                            # Use this model instead of the latest one
+    *   "optional_resulttable" : "nosave"       # Save all results in this table, don't save if "nosave".
+                                                # By default results_<properties>_<deviceID> per device.
+    *   "smoothing_window": 5, "smoothing_weight": 0.4, "persist_smoothing": false  # See GenericPredict
+    }
+
+    Returns per device the results in the order of the rows, or the error of the device:
+    {
+        "123456": {"anomaly_detected": [false, false], "ml_result": [1.0, 1.0]},
+        "654321": {"error": "Matching Model Not Found, Train your data first!"}
+    }
+    KPCA results also have "score", the reconstruction errors of the rows.
+    """
+
+    def POST(self):
+        print("-----------------------------------")
+        print("GenericBulkPredict Started")
+
+        try:
+            result = json.loads(web.data().decode('utf-8'))
+            algorithm = result["algorithm"]
+            cols = result["properties"]
+
+            if "devices" in result:
+                devices = result["devices"]
             else:
-                anomaly_detected = True
-            return anomaly_detected
+                devices = {str(result["deviceID"]): result["input"]}
 
-        if curr_result == 1.0:
-            # self.result_list.append(1)
-            pm_result_list.append(1)
-        else:
-            # self.result_list.append(0)
-            pm_result_list.append(0)
-
-        # calculate the last X result for a moving average
-        if len(pm_result_list) == self.moving_aver_size:
-            # temp = np.array(self.result_list)
-            temp = np.array(pm_result_list)
-            result_avg = np.mean(temp)
-            # self.result_list.pop(0)
-            pm_result_list.pop(0)
-            if result_avg < self.pm_weight:
-                anomaly_detected = True
+            if "database" in result:
+                database = result["database"]
             else:
-                anomaly_detected = False
-        else:
-            anomaly_detected = False
+                database = "predictive_maintenance"
+
+            if "idname" in result:
+                idname = str(result["idname"])
+            else:
+                idname = "deviceID"
+
+            if "para" in result:
+                para_arr = result["para"]
+            else:
+                para_arr = [0.01, 0.5]
+
+            if "modelID" in result:
+                modelID = int(result["modelID"])
+            else:
+                modelID = None
+
+            window = int(result.get("smoothing_window", 1))
+            weight = float(result.get("smoothing_weight", 0.4))
+            persist = bool(result.get("persist_smoothing", False))
+
+            if algorithm not in ('OCSVM', 'KNN', 'KPCA'):
+                raise Exception("Input algorithm not supported (Only supports OCSVM, KNN or KPCA).")
+
+        except Exception as e:
+            err = "Error occurred when reading data from post: " + str(e)
+            print(err)
+            return err
+
+        response = {}
+        resultRows = {}  # result table -> records to insert
+        try:
+            for deviceID, rows in devices.items():
+                deviceID = str(deviceID)
+                try:
+                    data = np.array(rows, dtype=float)
+                    if data.ndim == 1:  # a single row
+                        data = data.reshape(1, -1)
+                    if data.ndim != 2 or data.shape[1] != len(cols):
+                        raise ValueError("every row needs %d values (%s)" % (len(cols), ", ".join(cols)))
+
+                    model_table = MLDataAccess.modelTableName(algorithm, cols, para_arr, deviceID)
+                    pickledDict = loadModel(database, model_table, idname, deviceID, modelID)
+                    if pickledDict is None:
+                        response[deviceID] = {"error": "Matching Model Not Found, Train your data first!"}
+                        continue
+
+                    ml_results, scores = predictModel(algorithm, pickledDict, data, return_scores = True)
+                    ml_results = np.asarray(ml_results, dtype=float)
+
+                except Exception as e:
+                    err = "Error occurred while predicting: " + str(e)
+                    print(err)
+                    response[deviceID] = {"error": err}
+                    continue
+
+                # The rows are smoothed in their order, like consecutive GenericPredict requests
+                anomalies = np.array([resultSmoother.smooth(database, model_table, deviceID, ml_result,
+                                                            window, weight, persist) for ml_result in ml_results])
+                response[deviceID] = {"anomaly_detected": anomalies.tolist(), "ml_result": ml_results.tolist()}
+                if scores is not None:
+                    response[deviceID]["score"] = np.asarray(scores, dtype=float).tolist()
+
+                if "optional_resulttable" in result:
+                    resultTable = str(result["optional_resulttable"])
+                else:
+                    resultTable = "results_" + "".join(str(c) for c in cols) + "_" + deviceID
+                if resultTable == "nosave":
+                    continue
+
+                records = resultRows.setdefault(resultTable, [])
+                for i, (row, anomaly) in enumerate(zip(data.tolist(), anomalies.tolist())):
+                    rlt = dict(zip(cols, row))
+                    rlt['result'] = int(anomaly)
+                    if scores is not None:
+                        rlt['score'] = float(scores[i])
+                    rlt[idname] = deviceID
+                    records.append(rlt)
+
+            for resultTable, records in resultRows.items():
+                if MLDataAccess.writeRows(database, resultTable, records, idname) == False:
+                    print("Saving results in %s unsuccessful" % resultTable)
+                else:
+                    print("%d results saved in %s" % (len(records), resultTable))
+
+            return json.dumps(response)
+
+        except Exception as e:
+            err = "Error occurred during bulk prediction: " + str(e)
+            print(err)
+            return err
 
-        return anomaly_detected
+        finally:
+            print("GenericBulkPredict function finished!")
+            print("-----------------------------------")
 
 
 class GenericPlot(object):
@@ -535,20 +1032,9 @@ class GenericPlot(object):
 
         # Get Data from the columns mentioned in the request
         try:
-            # Creating query in python dict
-            req = {
-                'table': table,
-                'database': database,
-            }
-
-            # This is commented out as csv has all the IDs 0. So for now, just get the data using table name.
-            # data_response = requests.get(link + '/cloud/db/getTableDataByID/', data=json.dumps(req))
-
-
-            data_response = requests.get(link + '/cloud/db/getTableData/', data=json.dumps(req))
-            data_response = data_response.json()  # We get data in string, convert in json/dict.
-            data_response = pd.DataFrame(data_response)  # Convert to pandas df
-            # data = data_response[result["properties"]]  # Select columns matching the request
+            data_response = MLDataAccess.getTableFrame(database, table, properties)
+            if data_response is None:
+                return "Error in fetching data from the database"
             data_response = data_response.dropna()
             print(data_response)
         except Exception as e:
@@ -609,6 +1095,17 @@ class GenericGeneticAlgorithmControl(object):
             ng = int(result["ng"])
             error = float(result["error"])
 
+            # optional parallel backend: serial, thread, process or mpi
+            backend = None
+            workers = None
+            seed = None
+            if "backend" in result:
+                backend = str(result["backend"])
+            if "workers" in result:
+                workers = int(result["workers"])
+            if "seed" in result:
+                seed = int(result["seed"])
+
         except Exception as e:
             print("An error has occured in reading genetic algorithm parameters " + str(e))
             return e
@@ -617,7 +1114,8 @@ class GenericGeneticAlgorithmControl(object):
             geneticAlgorithmControl = GeneticAlgorithmControl(power_type=power_type, error=error, \
                                                               power=power, speed=speed, torque=torque, \
                                                               min_speed=min_speed, max_speed=max_speed, \
-                                                              int_speed=int_speed, alpha=alpha, beta=beta, ng=ng)
+                                                              int_speed=int_speed, alpha=alpha, beta=beta, ng=ng, \
+                                                              backend=backend, workers=workers, seed=seed)
             output = geneticAlgorithmControl.run()
             return output
 
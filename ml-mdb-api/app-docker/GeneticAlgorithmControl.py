@@ -9,7 +9,8 @@ import os
 from os import path
 
 from new_gaft import GAEngine
-from new_gaft.components import Population, FloatingPointIndividual
+from new_gaft.parallel import make_backend
+from new_gaft.components import Population, ArrayPopulation, FloatingPointIndividual
 from new_gaft.operators import TournamentSelection, IntermediateCrossover, SmallRandomMutation
 
 # Analysis plugin base class
@@ -22,11 +23,75 @@ from new_gaft.plugin_interfaces.functions.power_calculation_sim_no_noise import
 from new_gaft.plugin_interfaces.functions.power_calculation_sim_noise import PowerCalculationSimNoise
 from new_gaft.plugin_interfaces.functions.power_calculation_real import PowerCalculationReal
 
+# The fitness function of the genetic algorithm
+# a module-level class holding only numbers, so that it can be pickled and
+# evaluated in the worker processes of the parallel backends
+class ControlFitness(object):
+    def __init__(self, alpha, beta, power, speed, min_speed, max_speed, min_P, max_P):
+        self.alpha = alpha
+        self.beta = beta
+        self.power = power
+        self.speed = speed
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        # power at the lower and upper bounds of the chromosome space
+        self.min_P = min_P
+        self.max_P = max_P
+
+    # vectorized: evaluates the solutions of the whole population at once
+    def __call__(self, solutions):
+
+        a_norm = self.alpha
+        b_norm = self.beta
+
+        # get the lower and upper bounds of the calculated speed and power from genetic algorithm
+        rpm_min, rpm_max, P_min, P_max = solutions[:, 0], solutions[:, 1], solutions[:, 2], solutions[:, 3]
+        # the calculated speed and power is the average of the upper and lower bounds
+        rpm = 0.5*(rpm_min+rpm_max)
+        P = 0.5*(P_min+P_max)
+        P_err = self.power - P
+
+        # # conveyor belt length
+        # s = 0.66
+        # # conveyor belt radius
+        # r = 0.0181
+        # # linear velocity
+        # v_const = 2.0*np.pi/60.0*r
+        # v = v_const *rpm
+        # # total time on the conveyor belt
+        # t = s/v
+
+        # normalize speed and power by the upper and lower bounds of the chromosome space
+        min_v = self.min_speed
+        max_v = self.max_speed
+        min_P = self.min_P
+        max_P = self.max_P
+        P_err_min = self.power - max_P
+        P_err_max = self.power - min_P
+
+        v_norm = (rpm - min_v) / (max_v - min_v)
+        P_err_norm = (P_err - P_err_min) / (P_err_max - P_err_min)
+
+        # fitness function
+        # it should achieve the following functionalities:
+        # 1. the speed doesn't exceed the given range
+        # 2. the power is as close as possible to the regression formula's calculation result
+        # 3. the fitness is the least under the given weights
+        F = a_norm*v_norm + b_norm*P_err_norm
+
+        # restrain the ranges of power and speed
+        # speed cannot change too rapidly
+        # speed cannot be smaller than the lower bounds of the give speed range
+        F[(P_err_norm < 0) | (abs(self.speed - rpm) > 2)] = 0
+
+        return F
+
+
 # The class for genetic algorithm
 class GeneticAlgorithmControl():
     # initialize the population and genetic algorithm operators
     def __init__(self, power_type, error, power, speed, torque=0.0, min_speed = 10.0, max_speed=30.0, int_speed=2, \
-            alpha=1, beta=1, ng=50):
+            alpha=1, beta=1, ng=50, array_population=False, backend=None, workers=None, seed=None):
 
         # initialize parameters
         self.torque = torque
@@ -61,9 +126,16 @@ class GeneticAlgorithmControl():
         # init the population, should cover the whole chromosome space
         indv_template = FloatingPointIndividual(power_type=power_type, ranges=[(min_speed, max_speed),(min_speed, max_speed)], \
                             eps=0.001, pi=self.int_speed, torque = self.torque )
-        population = Population(indv_template=indv_template, size=60)
-        # initialize the whole population with the specified individual
-        population.init()
+        # the array population evolves a whole generation with array operations,
+        # the parallel backends (serial, thread, process or mpi) need it for the offspring generation
+        if array_population or backend is not None:
+            population = ArrayPopulation(indv_template=indv_template, size=60)
+            # initialize the whole population with the specified individual, reproducible for a given seed
+            population.init(rng=None if seed is None else np.random.RandomState(seed))
+        else:
+            population = Population(indv_template=indv_template, size=60)
+            # initialize the whole population with the specified individual
+            population.init()
 
         # create genetic algorithm operators
         selection = TournamentSelection(tournament_size=4)
@@ -77,7 +149,9 @@ class GeneticAlgorithmControl():
         # create genetic alrotithm engine
         self.engine = GAEngine(population=population, selection=selection,
                           crossover=crossover, mutation=mutation,
-                          analysis=[FitnessStore])
+                          analysis=[FitnessStore],
+                          backend=None if backend is None else make_backend(backend, workers),
+                          seed=seed)
 
     # a traditional minimum calculator to verify the correctness of the genetic algorithm
     def f_calc(self):
@@ -94,68 +168,17 @@ class GeneticAlgorithmControl():
     # the fitness calculation function
     def run(self):
         # register fitness function
-        @self.engine.fitness_register
-        def fitness(indv):
-
-            a_norm = self.alpha
-            b_norm = self.beta
-            c_norm = self.theta
-
-            # get the lower and upper bounds of the calculated speed and power from genetic algorithm
-            rpm_min, rpm_max, P_min, P_max = indv.solution
-            # the calculated speed and power is the average of the upper and lower bounds
-            rpm = 0.5*(rpm_min+rpm_max)
-            P = 0.5*(P_min+P_max)
-            P_err = self.power - P
-
-            # # conveyor belt length
-            # s = 0.66
-            # # conveyor belt radius
-            # r = 0.0181
-            # # linear velocity
-            # v_const = 2.0*np.pi/60.0*r
-            # v = v_const *rpm
-            # # total time on the conveyor belt
-            # t = s/v
-            
-            # normalize speed and power by the upper and lower bounds of the chromosome space
-            min_v = self.min_speed
-            max_v = self.max_speed
-            min_P = self.power_calc.calculation(min_v)
-            max_P = self.power_calc.calculation(max_v)           
-            P_err_min = self.power - max_P
-            P_err_max = self.power - min_P
-
-            v_norm = (rpm - min_v) / (max_v - min_v)
-            v_real_norm = (self.speed - min_v) / (max_v - min_v)
-            v_err_norm = (v_real_norm - v_norm)
-            P_norm = (P - min_P) / (max_P - min_P)
-            P_err_norm = (P_err - P_err_min) / (P_err_max - P_err_min) 
-
-            self.v_norm = v_norm
-            self.P_err_norm = P_err_norm
-            self.v_err_norm = v_err_norm
-
-            # fitness function
-            # it should achieve the following functionalities:
-            # 1. the speed doesn't exceed the given range
-            # 2. the power is as close as possible to the regression formula's calculation result
-            # 3. the fitness is the least under the given weights
-            F = a_norm*v_norm + b_norm*P_err_norm
-
-            # restrain the ranges of power and speed
-            # speed cannot change too rapidly
-            # speed cannot be smaller than the lower bounds of the give speed range
-            if P_err_norm < 0 or abs(self.speed - rpm) > 2:
-                F = 0
-            self.F = F
-
-            return F
-
+        # vectorized: evaluates the solutions of the whole population at once
+        self.engine.batch_fitness_register(ControlFitness(
+            alpha=self.alpha, beta=self.beta, power=self.power, speed=self.speed,
+            min_speed=self.min_speed, max_speed=self.max_speed,
+            min_P=self.power_calc.calculation(self.min_speed), max_P=self.power_calc.calculation(self.max_speed)))
 
         n_gen = self.ng
         self.engine.run(ng=n_gen)
         best_indv = self.engine.population.best_indv(self.engine.fitness)
+        # fitness of the best individual
+        self.F = self.engine.fmax
         print (best_indv.solution)
         
         # output dict
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+Parallel hyperparameter search for the anomaly detection models
+
+The training data is split into a training and a held-out part. Every candidate "para" is fitted on the
+training part in a thread (or process) pool and scored by
+- false_alarm_rate: fraction of the held-out (normal) data predicted as anomaly
+- outlier_rate: fraction of uniform random points in the bounding box of the data (10% margin) predicted
+  as anomaly, i.e. how tight the learned region is
+- score = (1 - false_alarm_rate) * outlier_rate, higher is better
+
+The search runs in a request or job thread of the server, so the process pool spawns its workers instead of
+forking the multi-threaded server process (a forked child can inherit locks held by other threads).
+"""
+
+import itertools
+import multiprocessing
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+import GenericMachineLearningAPI
+
+
+def candidates(grid = None, candidate_list = None, n_iter = 0, seed = 0):
+    """
+    Parameter combinations to evaluate
+    :param grid: list of the values of each para position, e.g. [[0.01, 0.1], [0.1, 0.5, 1]]
+    :param candidate_list: explicit list of para arrays, used instead of the grid
+    :param n_iter: if > 0, random search: n_iter combinations are drawn from the grid
+    :return: list of para arrays
+    """
+    if candidate_list:
+        cands = [list(c) for c in candidate_list]
+    else:
+        cands = [list(c) for c in itertools.product(*grid)]
+
+    if n_iter and int(n_iter) < len(cands):
+        cands = random.Random(seed).sample(cands, int(n_iter))
+    return cands
+
+
+def splitData(data, validation = 0.2, seed = 0):
+    """
+    :return: training rows, held-out rows
+    """
+    data = np.asarray(data, dtype = float)
+    index = np.random.RandomState(seed).permutation(len(data))
+    n_validation = max(1, int(len(data) * validation))
+    return data[index[n_validation:]], data[index[:n_validation]]
+
+
+def syntheticOutliers(data, n, margin = 0.1, seed = 0):
+    """
+    :return: n uniform random points in the bounding box of data, extended by margin on each side
+    """
+    low = data.min(axis = 0)
+    high = data.max(axis = 0)
+    extent = high - low
+    return np.random.RandomState(seed).uniform(low - margin * extent, high + margin * extent,
+                                               size = (n, data.shape[1]))
+
+
+def evaluate(algorithm, options, train, validation, outliers, para_arr):
+    """
+    Fits and scores one candidate. Runs in the worker threads or processes.
+    :return: dict with para, rates, score and timing, or the error of the candidate
+    """
+    start = time.time()
+    try:
+        model, pickledDict = GenericMachineLearningAPI.fitModel(algorithm, train, para_arr, options)
+        fit_time = time.time() - start
+
+        start = time.time()
+        false_alarm_rate = float(np.mean(GenericMachineLearningAPI.predictModel(algorithm, pickledDict, validation) != 1))
+        outlier_rate = float(np.mean(GenericMachineLearningAPI.predictModel(algorithm, pickledDict, outliers) != 1))
+        predict_time = time.time() - start
+
+        return {
+            "para": para_arr,
+            "score": (1.0 - false_alarm_rate) * outlier_rate,
+            "false_alarm_rate": false_alarm_rate,
+            "outlier_rate": outlier_rate,
+            "fit_time": fit_time,
+            "predict_time": predict_time
+        }
+
+    except Exception as e:
+        return {"para": para_arr, "score": None, "error": str(e), "fit_time": time.time() - start}
+
+
+def search(algorithm, data, cands, options = {}, validation = 0.2, workers = 4, backend = "thread", progress = None):
+    """
+    Evaluates all candidates in parallel
+    :param backend: "thread" (thread pool) or "process" (pool of spawned processes)
+    :param progress: optional function(fraction) called after each finished candidate
+    :return: leaderboard, best candidate first, failed candidates last
+    """
+    train, held_out = splitData(data, validation)
+    outliers = syntheticOutliers(train, max(len(held_out), 1000))
+
+    task = partial(evaluate, algorithm, dict(options), train, held_out, outliers)
+    if backend == "process":
+        pool = multiprocessing.get_context("spawn").Pool(workers)
+        runner = pool.imap
+    elif backend == "thread":
+        pool = ThreadPoolExecutor(max_workers = workers)
+        runner = pool.map
+    else:
+        raise ValueError("Unknown backend %s (Only supports process or thread)." % backend)
+
+    results = []
+    try:
+        for res in runner(task, cands):
+            results.append(res)
+            if progress is not None:
+                progress(float(len(results)) / len(cands))
+    finally:
+        if backend == "process":
+            pool.close()
+            pool.join()
+        else:
+            pool.shutdown()
+
+    return sorted(results, key = lambda r: (r["score"] is None, -(r["score"] or 0.0)))
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+"""
+Background job queue for long running ML requests (e.g. training)
+
+Jobs are executed by a pool of worker threads in this process. Their status is kept in memory and written to
+the table "jobs" of the jobs database on every change, so in prefork server mode (every worker process has its
+own queue) the status of a job can be requested from any worker. Stored jobs expire after a week.
+A training job only invalidates the model cache of its own process; the other workers notice the new model by
+the _id of its record (see ModelCache).
+"""
+
+import datetime
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+import pymongo
+
+import ChariotCloudAPI
+
+JOB_TABLE = "jobs"
+# Seconds a stored job is kept after its last change
+JOB_EXPIRY = 7 * 24 * 3600
+
+
+def addTiming(status):
+    """
+    Adds wait_time and run_time (up to now for jobs that are not done) to a job status dict
+    :return: status
+    """
+    if status["started_at"] is None:
+        status["wait_time"] = time.time() - status["submitted_at"]
+        status["run_time"] = None
+    else:
+        status["wait_time"] = status["started_at"] - status["submitted_at"]
+        status["run_time"] = (status["finished_at"] or time.time()) - status["started_at"]
+    return status
+
+
+class Job(object):
+    """
+    One submitted job and its status
+    """
+
+    def __init__(self, kind, func, args, kwargs, onChange = None):
+        """
+        :param onChange: optional function(job) called after every change of the status
+        """
+        self.id = str(uuid.uuid4())
+        self.onChange = onChange
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "queued"
+        self.progress = 0.0
+        self.stage = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def setProgress(self, progress, stage = None):
+        """
+        Called by the job function to report its progress
+        :param progress: fraction done, 0.0 to 1.0
+        :param stage: optional name of the current step
+        """
+        self.progress = float(progress)
+        if stage is not None:
+            self.stage = stage
+        self.changed()
+
+    def changed(self):
+        if self.onChange is not None:
+            self.onChange(self)
+
+    def run(self):
+        self.status = "running"
+        self.started_at = time.time()
+        self.changed()
+        try:
+            res = self.func(*self.args, progress = self.setProgress, **self.kwargs)
+            # The handlers return exceptions instead of raising them
+            if isinstance(res, Exception):
+                self.status = "failed"
+                self.error = str(res)
+            else:
+                self.status = "finished"
+                self.result = res
+                self.progress = 1.0
+                self.stage = "done"
+
+        except Exception as e:
+            traceback.print_exc()
+            self.status = "failed"
+            self.error = str(e)
+
+        finally:
+            self.finished_at = time.time()
+            self.changed()
+
+    def toDict(self):
+        """
+        :return: JSON serializable status of the job
+        """
+        return addTiming({
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        })
+
+
+class JobQueue(object):
+    """
+    Bounded queue of jobs executed by a fixed number of worker threads. The workers are started on the
+    first submit. The status of the last `history` jobs is kept in memory and all of them in the jobs table.
+    """
+
+    def __init__(self, name, workers = 1, maxsize = 16, history = 1000, database = "predictive_maintenance"):
+        """
+        :param database: database of the jobs table shared by all server processes, None keeps the jobs in memory only
+        """
+        self.name = name
+        self.workers = workers
+        self.maxsize = maxsize
+        self.history = history
+        self.database = database
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.queue = None
+        self.threads = []
+        self.indexed = False
+
+    def configure(self, workers = None, maxsize = None, database = None):
+        """
+        Set the number of worker threads, the queue size and the jobs database. Has no effect after the first submit.
+        """
+        with self.lock:
+            if workers is not None:
+                self.workers = max(1, int(workers))
+            if maxsize is not None:
+                self.maxsize = int(maxsize)
+            if database is not None:
+                self.database = str(database) or None
+
+    def _table(self):
+        mdbobject = ChariotCloudAPI.makeObject(dbName = self.database, dbCollection = JOB_TABLE)
+        if not self.indexed:
+            mdbobject.collection.create_index([("job_id", pymongo.ASCENDING)], unique = True)
+            mdbobject.collection.create_index([("updated", pymongo.ASCENDING)], expireAfterSeconds = JOB_EXPIRY)
+            self.indexed = True
+        return mdbobject.collection
+
+    def _status(self, job):
+        """
+        :return: status dict of a job of this process, with the queue and the process running it
+        """
+        status = job.toDict()
+        status["queue"] = self.name
+        # identifies the server process running the job (prefork workers are forked after the import)
+        status["worker"] = "%s:%d" % (socket.gethostname(), os.getpid())
+        return status
+
+    def _save(self, job):
+        """
+        Write the status of a job to the jobs table. Errors are printed, the job goes on.
+        """
+        if self.database is None:
+            return
+        try:
+            status = self._status(job)
+            # the result is stored as the JSON it is returned as (no numpy or other non BSON types)
+            status["result"] = json.loads(json.dumps(status["result"], default=str))
+            status["updated"] = datetime.datetime.utcnow()
+            self._table().replace_one({"job_id": job.id}, status, upsert = True)
+
+        except Exception as e:
+            print("Error saving the status of job %s: %s" % (job.id, e))
+
+    def _load(self, query, limit = 0):
+        """
+        :return: stored status dicts matching query, oldest first
+        """
+        cursor = self._table().find(dict(query, queue = self.name), projection = {"_id": 0, "updated": 0},
+                                    sort = [("submitted_at", pymongo.ASCENDING)], limit = limit)
+        return [addTiming(status) for status in cursor]
+
+    def _start(self):
+        self.queue = queue.Queue(maxsize = self.maxsize)
+        for i in range(self.workers):
+            thread = threading.Thread(target = self._work, name = "%s-worker-%d" % (self.name, i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                job.run()
+            finally:
+                self.queue.task_done()
+
+    def submit(self, kind, func, *args, **kwargs):
+        """
+        Queue func(*args, progress = callback, **kwargs) for execution
+        :return: the Job
+        :raise queue.Full: if maxsize jobs are already waiting
+        """
+        job = Job(kind, func, args, kwargs, onChange = self._save)
+        with self.lock:
+            if self.queue is None:
+                self._start()
+            # Only submit puts into the queue (under the lock), so it is still not full after saving. The job is
+            # saved before a worker can pick it up, which would save it as running.
+            if self.queue.full():
+                raise queue.Full
+            self._save(job)
+            self.queue.put_nowait(job)
+            self.jobs[job.id] = job
+
+            # Forget the oldest jobs that are done
+            while len(self.jobs) > self.history:
+                oldest = next(iter(self.jobs))
+                if self.jobs[oldest].finished_at is None:
+                    break
+                del self.jobs[oldest]
+        return job
+
+    def get(self, job_id):
+        """
+        :return: Job with the given id or None
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        """
+        :return: all known jobs of this process, oldest first
+        """
+        with self.lock:
+            return list(self.jobs.values())
+
+    def status(self, job_id):
+        """
+        Status of a job of any server process: from memory if run by this process, else from the jobs table
+        :return: status dict or None if unknown
+        """
+        job = self.get(job_id)
+        if job is not None:
+            return self._status(job)
+        if self.database is None:
+            return None
+        stored = self._load({"job_id": job_id}, 1)
+        return stored[0] if stored else None
+
+    def listStatus(self):
+        """
+        :return: status dicts of the last `history` jobs of all server processes (of this process only without
+                 a jobs database), oldest first
+        """
+        if self.database is None:
+            return [self._status(job) for job in self.list()]
+        newest = list(self._table().find({"queue": self.name}, projection = {"submitted_at": 1},
+                                         sort = [("submitted_at", pymongo.DESCENDING)], limit = self.history))
+        if not newest:
+            return []
+        return self._load({"submitted_at": {"$gte": newest[-1]["submitted_at"]}})
+
+    def stats(self):
+        """
+        :return: dict with the number of jobs per status and the configuration
+        """
+        res = {"workers": self.workers, "maxsize": self.maxsize, "queued": 0, "running": 0, "finished": 0, "failed": 0}
+        for job in self.list():
+            res[job.status] += 1
+        return res
+
+
+trainingJobs = JobQueue("train")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+"""
+In-process data access for the ML APIs
+
+The ML handlers run inside the same process as the DB APIs, so they read and write MongoDB directly
+through the pooled MongoDBAPI objects instead of calling /cloud/db/... over HTTP.
+"""
+
+import numpy as np
+import pandas as pd
+
+import ChariotCloudAPI
+
+
+def rawTableName(properties, deviceID):
+    """
+    Name of the table holding the raw data of a device, e.g. raw_velocitypower_in_123456
+    """
+    property_id = ""
+    for property_key in properties:
+        property_id = property_id + str(property_key)
+    return "raw" + "_" + property_id + "_" + str(deviceID)
+
+
+def modelTableName(algorithm, properties, para_arr, deviceID):
+    """
+    Name of the table holding the models of a device, e.g. OCSVM_model_velocitypower_in_0.01_0.5_123456
+    An approximate KPCA (para [alpha, gamma, n_landmarks, approximation]) also has the number of landmarks and
+    the approximation in the name, e.g. KPCA_model_velocitypower_in_0.3_4_500_nystroem_123456
+    """
+    property_id = ""
+    for property_key in properties:
+        property_id = property_id + str(property_key)
+    para_id = str(para_arr[0]) + "_" + str(para_arr[1])
+    if algorithm == "KPCA" and len(para_arr) > 2:
+        approximation = para_arr[3] if len(para_arr) > 3 else "nystroem"
+        para_id = para_id + "_" + str(int(para_arr[2])) + "_" + str(approximation)
+    return str(algorithm) + "_model_" + property_id + "_" + para_id + "_" + str(deviceID)
+
+
+def readWindow(result):
+    """
+    Optional filter and time window ("filter", "timestamp", "from", "to") of an ML request
+    :return: keyword arguments for getTableFrame / getTableArray
+    """
+    return ChariotCloudAPI.readFindArguments(result)
+
+
+def _findCursor(database, table, properties, findQuery, timeField, fromTime, toTime):
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = table)
+    if mdbobject.checkCollectionExists() == False:
+        print("Invalid/ Nonexistent Collection: " + str(table))
+        return None
+
+    query = mdbobject.buildQuery({} if findQuery is None else findQuery, timeField, fromTime, toTime)
+    projection = mdbobject.buildProjection(properties, {'_id': False})
+    return mdbobject.collection.find(query, projection = projection)
+
+
+def getTableFrame(database, table, properties = None, findQuery = None, timeField = "timestamp",
+                  fromTime = None, toTime = None):
+    """
+    Read a table into a pandas DataFrame
+    :param properties: columns to read. Only these fields are fetched from the database. All columns if None.
+    :param findQuery: optional MongoDB filter
+    :param timeField, fromTime, toTime: optional time window, see MongoDBAPI.buildQuery
+    :return: DataFrame, None if the table does not exist
+    """
+    cursor = _findCursor(database, table, properties, findQuery, timeField, fromTime, toTime)
+    if cursor is None:
+        return None
+    return pd.DataFrame(list(cursor), columns = properties)
+
+
+def getTableArray(database, table, properties, findQuery = None, timeField = "timestamp",
+                  fromTime = None, toTime = None):
+    """
+    Read the given columns of a table into a 2D float NumPy array (rows x properties)
+    :return: array, None if the table does not exist
+    """
+    cursor = _findCursor(database, table, properties, findQuery, timeField, fromTime, toTime)
+    if cursor is None:
+        return None
+
+    rows = [[record.get(prop, np.nan) for prop in properties] for record in cursor]
+    return np.array(rows, dtype = float).reshape(-1, len(properties))
+
+
+def getRecordsByID(database, table, idname, id):
+    """
+    All records of a table where idname equals id
+    :return: list of records, empty list if none found
+    """
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = table)
+    if mdbobject.checkCollectionExists() == False:
+        return []
+
+    query = {}
+    query[idname] = id
+    res = mdbobject.findRecord(query, {'_id': 0})
+    if not res:
+        return []
+    return res
+
+
+def getModelRecordID(database, table, idname, id, modelID = None):
+    """
+    _id of one model record of a device, read with an _id-only projection on the (idname, _id) index.
+    The model cache uses it as key, so a model trained in another process is noticed.
+    :param modelID: index of the model in the order the models were saved (negative counts from the end).
+                    If None, the latest model is returned.
+    :return: ObjectId or None if not found
+    """
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = table)
+    query = {}
+    query[idname] = id
+    if modelID is None or int(modelID) < 0:
+        skip = 0 if modelID is None else -int(modelID) - 1
+        sort = [('_id', -1)]
+    else:
+        skip = int(modelID)
+        sort = [('_id', 1)]
+    records = list(mdbobject.collection.find(query, projection = {'_id': 1}, sort = sort, skip = skip, limit = 1))
+    return records[0]['_id'] if records else None
+
+
+def getModelRecordByRecordID(database, table, recordID):
+    """
+    Model record with the given _id
+    :return: record or None if not found
+    """
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = table)
+    return mdbobject.collection.find_one({'_id': recordID}, projection = {'_id': 0})
+
+
+def writeOneRow(database, table, data, idname):
+    """
+    Insert one record. A copy is inserted so that data does not get an _id field.
+    The standard indexes of the table are ensured on first write.
+    :return: True if successful
+    """
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = table)
+    success = mdbobject.insertOneRecord(dict(data))
+    mdbobject.ensureIndexes(idname)
+    return success
+
+
+def writeRows(database, table, rows, idname):
+    """
+    Insert a list of records
+    :return: True if successful
+    """
+    if len(rows) == 0:
+        return True
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = table)
+    success = mdbobject.insertRecords(rows)
+    mdbobject.ensureIndexes(idname)
+    return success
+
+
+def replaceTable(database, table, rows, idname):
+    """
+    Drop the table if it exists and store the given records in it
+    :return: True if successful
+    """
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = table)
+    mdbobject.dropCollection()
+    return writeRows(database, table, rows, idname)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Micro-batching of concurrent real-time predictions
+
+Real-time predict requests for the same model that arrive within a short time window are collected
+into one batch. The first request of a batch waits up to max_latency seconds (or until max_batch rows
+arrived), runs one vectorized prediction on all rows and hands every waiting request its result.
+Disabled while max_latency is 0.
+"""
+
+import threading
+
+import numpy as np
+
+
+class _Batch(object):
+    """
+    Rows collected for one model and the result of their prediction
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher(object):
+
+    def __init__(self, max_latency = 0.0, max_batch = 64):
+        """
+        :param max_latency: seconds a batch waits for more rows, 0 disables batching
+        :param max_batch: maximum number of rows of a batch
+        """
+        self.max_latency = max_latency
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+
+    def configure(self, max_latency = None, max_batch = None):
+        with self.lock:
+            if max_latency is not None:
+                self.max_latency = float(max_latency)
+            if max_batch is not None:
+                self.max_batch = max(1, int(max_batch))
+
+    def enabled(self):
+        return self.max_latency > 0
+
+    def predict(self, key, func, row):
+        """
+        Predict one row together with the rows of concurrent requests for the same key
+        :param key: identifies the model, e.g. (database, model table, _id of the model record)
+        :param func: function(2D array of rows) returning one result per row
+        :param row: 1D feature values
+        :return: result of the row
+        :raise: the exception raised by func
+        """
+        with self.lock:
+            batch = self.pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self.pending[key] = batch
+            index = len(batch.rows)
+            batch.rows.append(row)
+            if len(batch.rows) >= self.max_batch:
+                # Later requests start a new batch
+                del self.pending[key]
+                batch.full.set()
+
+        if not leader:
+            batch.done.wait()
+        else:
+            batch.full.wait(self.max_latency)
+            with self.lock:
+                if self.pending.get(key) is batch:
+                    del self.pending[key]
+                self.batches += 1
+                self.rows += len(batch.rows)
+                self.largest_batch = max(self.largest_batch, len(batch.rows))
+
+            try:
+                batch.results = func(np.array(batch.rows))
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    def stats(self):
+        """
+        :return: dict with the configuration and the batch counters
+        """
+        with self.lock:
+            return {
+                "max_latency": self.max_latency,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "rows": self.rows,
+                "mean_batch": float(self.rows) / self.batches if self.batches else None,
+                "largest_batch": self.largest_batch
+            }
+
+
+predictBatcher = MicroBatcher()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+"""
+In-memory LRU cache of deserialized models for the prediction APIs
+
+Entries are keyed by (database, model table, _id of the model record). In prefork server mode a new model is
+trained (and the cache invalidated) in one worker process only: the other workers find the new _id of the latest
+model and load it, the old entry is evicted by the LRU order.
+The cache is bounded by the number of entries and by the (estimated) size of the stored models.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ModelCache(object):
+
+    def __init__(self, max_entries = 128, max_bytes = 512 * 1024 * 1024):
+        """
+        :param max_entries: maximum number of cached models, 0 disables the cache
+        :param max_bytes: maximum sum of the model sizes
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, max_entries = None, max_bytes = None):
+        with self.lock:
+            if max_entries is not None:
+                self.max_entries = int(max_entries)
+            if max_bytes is not None:
+                self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def get(self, database, model_table, recordID):
+        """
+        :param recordID: _id (string) of the model record
+        :return: cached model or None
+        """
+        key = (database, model_table, recordID)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, database, model_table, recordID, model, size):
+        """
+        Cache a model
+        :param size: size of the model in bytes (e.g. length of its serialization)
+        """
+        key = (database, model_table, recordID)
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            if self.max_entries <= 0 or size > self.max_bytes:
+                return
+            self.entries[key] = (model, size)
+            self.bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            key, (model, size) = self.entries.popitem(last = False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def invalidate(self, database, model_table):
+        """
+        Remove all cached models of a table, e.g. after a new model was saved in it
+        """
+        with self.lock:
+            for key in list(self.entries):
+                if key[0] == database and key[1] == model_table:
+                    self.bytes -= self.entries.pop(key)[1]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        :return: dict with size, limits and hit / miss / eviction counters
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+modelCache = ModelCache()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""
+Warm start of the model cache
+
+Loads the latest model of every model table (*_model_*) of the given databases into the in-process model
+cache, with a pool of threads, so the first predictions after a (re)start do not have to fetch and
+deserialize their models. At most as many models as the cache holds are loaded.
+Readiness is reported only after the preloading finished.
+Model files replaced by upgrades (ModelStore.replaceModel) are purged from the databases before preloading.
+In prefork server mode every worker process preloads its own cache.
+"""
+
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import ChariotCloudAPI
+import GenericMachineLearningAPI
+import ModelStore
+import MongoDBDriver
+from ModelCache import modelCache
+
+
+class ModelPreloader(object):
+
+    def __init__(self, databases = None, workers = 4, idname = "deviceID"):
+        """
+        :param databases: databases searched for model tables
+        :param workers: number of models loaded at the same time
+        :param idname: field of the model records holding the device id, as given by the predict requests
+        """
+        self.databases = databases if databases is not None else ["predictive_maintenance"]
+        self.workers = workers
+        self.idname = idname
+        self.lock = threading.Lock()
+        self.thread = None
+        self.status = "idle"
+        self.total = 0
+        self.loaded = 0
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+
+    def configure(self, databases = None, workers = None, idname = None):
+        with self.lock:
+            if databases is not None:
+                self.databases = list(databases)
+            if workers is not None:
+                self.workers = max(1, int(workers))
+            if idname is not None:
+                self.idname = str(idname)
+
+    def ready(self):
+        """
+        :return: False while a preload is running
+        """
+        return self.status != "running"
+
+    def start(self, databases = None, workers = None, idname = None):
+        """
+        Preload in a background thread
+        :return: False if a preload is already running
+        """
+        with self.lock:
+            if self.status == "running":
+                return False
+            self._reset()
+            self.thread = threading.Thread(target = self._run, args = (databases, workers, idname), name = "model-preloader")
+            self.thread.daemon = True
+            self.thread.start()
+        return True
+
+    def wait(self, timeout = None):
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready()
+
+    def _reset(self):
+        self.status = "running"
+        self.total = 0
+        self.loaded = 0
+        self.errors = []
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def _run(self, databases, workers, idname):
+        print("Model preloading started")
+        try:
+            self.preload(databases, workers, idname)
+            self.status = "ready"
+        except Exception as e:
+            traceback.print_exc()
+            self.errors.append(str(e))
+            self.status = "failed"
+        finally:
+            self.finished_at = time.time()
+            print("Model preloading finished: %d of %d models loaded in %.2f s" %
+                  (self.loaded, self.total, self.finished_at - self.started_at))
+
+    def modelTables(self, databases = None):
+        """
+        :return: list of (database, model table) of the given databases
+        """
+        tables = []
+        for database in (databases if databases is not None else self.databases):
+            mdbobject = ChariotCloudAPI.makeObject(dbName = database)
+            for table in sorted(mdbobject.database.list_collection_names()):
+                if MongoDBDriver.indexManager.tableKind(table) == "model":
+                    tables.append((database, table))
+        return tables
+
+    def preload(self, databases = None, workers = None, idname = None):
+        """
+        Load the latest model of each device of each model table into the model cache
+        :param idname: field of the model records holding the device id, self.idname by default
+        :return: number of loaded models
+        """
+        idname = str(idname) if idname is not None else self.idname
+        for database in (databases if databases is not None else self.databases):
+            try:
+                deleted = ModelStore.purgeReplaced(database)
+                if deleted:
+                    print("%d replaced model files deleted in %s" % (deleted, database))
+            except Exception as e:
+                with self.lock:
+                    self.errors.append("%s: %s" % (database, e))
+
+        jobs = []
+        for database, table in self.modelTables(databases):
+            mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = table)
+            for deviceID in mdbobject.collection.distinct(idname):
+                jobs.append((database, table, deviceID))
+        jobs = jobs[:modelCache.max_entries]
+        self.total = len(jobs)
+
+        def load(job):
+            database, table, deviceID = job
+            try:
+                if GenericMachineLearningAPI.loadModel(database, table, idname, deviceID) is not None:
+                    with self.lock:
+                        self.loaded += 1
+            except Exception as e:
+                with self.lock:
+                    self.errors.append("%s.%s: %s" % (database, table, e))
+
+        with ThreadPoolExecutor(max_workers = workers or self.workers) as executor:
+            list(executor.map(load, jobs))
+        return self.loaded
+
+    def stats(self):
+        """
+        :return: dict with status, progress and errors of the last preload
+        """
+        with self.lock:
+            return {
+                "ready": self.ready(),
+                "status": self.status,
+                "databases": self.databases,
+                "idname": self.idname,
+                "total": self.total,
+                "loaded": self.loaded,
+                "errors": self.errors[-20:],
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "duration": (self.finished_at or time.time()) - self.started_at if self.started_at else None
+            }
+
+
+modelPreloader = ModelPreloader()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+Binary model storage in GridFS
+
+The trained model (dict with clf and intermediate variables) is serialized with joblib (optionally compressed)
+into the GridFS bucket "models" of the database. The model table only holds a small metadata record pointing
+to the file, so models are not limited by the 16 MB document size.
+
+Records of models saved before (jsonpickle string in the "model" field) are still loaded.
+"""
+
+import time
+
+import gridfs
+import joblib
+import jsonpickle
+from bson.objectid import ObjectId
+
+import ChariotCloudAPI
+
+BUCKET = "models"
+# Seconds a replaced model file is kept for processes that read its record before the replacement
+REPLACED_FILE_AGE = 3600
+
+
+def uploadModel(bucket, model_table, pickledDict, deviceID, compress):
+    """
+    Serialize a model into a new GridFS file
+    :return: the closed upload stream (_id and length of the file)
+    """
+    stream = bucket.open_upload_stream(model_table, metadata = {"model_table": model_table, "deviceID": deviceID})
+    try:
+        joblib.dump(pickledDict, stream, compress = compress)
+    except Exception:
+        stream.abort()
+        raise
+    stream.close()
+    return stream
+
+
+def saveModel(database, model_table, pickledDict, metadata, compress = 3):
+    """
+    Store a model in GridFS and its metadata record in the model table
+    :param metadata: dict with algorithm, para, properties, deviceID, ... of the model
+    :param compress: zlib compression level 0-9, 0 disables compression
+    :return: the metadata record, None if saving failed
+    """
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = model_table)
+    bucket = gridfs.GridFSBucket(mdbobject.database, bucket_name = BUCKET)
+
+    stream = uploadModel(bucket, model_table, pickledDict, metadata.get("deviceID"), compress)
+
+    record = dict(metadata)
+    record["storage"] = "gridfs"
+    record["file_id"] = str(stream._id)
+    record["size"] = stream.length
+    record["compress"] = compress
+    record["created_at"] = time.time()
+
+    if mdbobject.insertOneRecord(dict(record)) == False:
+        bucket.delete(stream._id)
+        return None
+    # Model records always store the key of the device in the field "deviceID"
+    mdbobject.ensureIndexes("deviceID")
+    return record
+
+
+def replaceModel(database, model_table, recordID, record, pickledDict, compress = 3):
+    """
+    Store a changed model (e.g. upgraded to a newer format) in place of the model of an existing record.
+    The record keeps its _id, legacy records are converted to GridFS storage. The replaced file is only marked,
+    other processes may still be loading it, and deleted later by purgeReplaced.
+    :param record: the record as loaded, the update only applies if its model was not replaced in the meantime
+    :return: the updated record, None if the record changed in the meantime
+    """
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database, dbCollection = model_table)
+    bucket = gridfs.GridFSBucket(mdbobject.database, bucket_name = BUCKET)
+
+    stream = uploadModel(bucket, model_table, pickledDict, record.get("deviceID"), compress)
+
+    update = {"storage": "gridfs", "file_id": str(stream._id), "size": stream.length, "compress": compress}
+    query = {"_id": recordID}
+    if record.get("storage") == "gridfs":
+        query["file_id"] = record["file_id"]
+    else:
+        query["storage"] = {"$exists": False}
+    result = mdbobject.collection.update_one(query, {"$set": update, "$unset": {"model": "", "clf": ""}})
+    if result.modified_count == 0:
+        bucket.delete(stream._id)
+        return None
+
+    if record.get("storage") == "gridfs":
+        mdbobject.database[BUCKET + ".files"].update_one({"_id": ObjectId(record["file_id"])},
+                                                         {"$set": {"metadata.replaced_at": time.time()}})
+    record = dict(record)
+    record.pop("model", None)
+    record.pop("clf", None)
+    record.update(update)
+    return record
+
+
+def purgeReplaced(database, min_age = REPLACED_FILE_AGE):
+    """
+    Delete the model files replaced by replaceModel at least min_age seconds ago
+    :return: number of deleted files
+    """
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database)
+    bucket = gridfs.GridFSBucket(mdbobject.database, bucket_name = BUCKET)
+    files = mdbobject.database[BUCKET + ".files"].find({"metadata.replaced_at": {"$lt": time.time() - min_age}},
+                                                       projection = {"_id": 1})
+    deleted = 0
+    for f in list(files):
+        try:
+            bucket.delete(f["_id"])
+            deleted += 1
+        except gridfs.errors.NoFile:
+            pass  # deleted by another process
+    return deleted
+
+
+def loadModel(database, record):
+    """
+    Load the model of a metadata record
+    :return: model dict
+    """
+    if record.get("storage") != "gridfs":
+        return jsonpickle.decode(record["model"])
+
+    mdbobject = ChariotCloudAPI.makeObject(dbName = database)
+    bucket = gridfs.GridFSBucket(mdbobject.database, bucket_name = BUCKET)
+    # The file is read chunk by chunk by joblib
+    stream = bucket.open_download_stream(ObjectId(record["file_id"]))
+    try:
+        return joblib.load(stream)
+    finally:
+        stream.close()
+
+
+def modelSize(record):
+    """
+    Size of the serialized model in bytes
+    """
+    if "size" in record:
+        return int(record["size"])
+    return len(record.get("model", ""))
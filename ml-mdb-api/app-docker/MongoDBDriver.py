@@ -7,16 +7,266 @@ MongoDB API Driver
 @contact: s.gokhale@campus.tu-berlin.de
 """
 
+import atexit
+import os
+import threading
+
 import pymongo
+from pymongo import monitoring
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener counting checkouts, checkins and connections of all pooled clients
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "pools_created": 0,
+            "pools_cleared": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts_started": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checkins": 0
+        }
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        """
+        Copy of the current counters
+        :return: dict with counter values and the number of connections currently checked out
+        """
+        with self.lock:
+            res = dict(self.counters)
+        res["checked_out_now"] = res["checkouts"] - res["checkins"]
+        res["open_connections"] = res["connections_created"] - res["connections_closed"]
+        return res
+
+    def pool_created(self, event):
+        self.count("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.count("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.count("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.count("connections_closed")
+
+    def connection_check_out_started(self, event):
+        self.count("checkouts_started")
+
+    def connection_check_out_failed(self, event):
+        self.count("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self.count("checkouts")
+
+    def connection_checked_in(self, event):
+        self.count("checkins")
+
+
+class MongoClientRegistry:
+    """
+    Process-wide registry of MongoClients. One client (and thereby one connection pool) is kept per
+    link and credentials, and database / collection handles are cached so that every MongoDBAPI object
+    reuses them instead of connecting again.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clients = {}
+        self.handles = {}
+        self.metrics = PoolMetrics()
+        self.pid = os.getpid()
+        # Options passed to every new MongoClient. None means pymongo default.
+        self.options = {
+            "maxPoolSize": 100,
+            "minPoolSize": 0,
+            "maxIdleTimeMS": None,
+            "connectTimeoutMS": 20000,
+            "socketTimeoutMS": None,
+            "serverSelectionTimeoutMS": 30000,
+            "waitQueueTimeoutMS": None
+        }
+
+    def configure(self, **options):
+        """
+        Set client options (pool size, timeouts). Only clients created afterwards are affected.
+        :param options: MongoClient keyword options, e.g. maxPoolSize = 50. None values are ignored.
+        """
+        with self.lock:
+            for key in options:
+                if options[key] is not None:
+                    self.options[key] = options[key]
+
+    def _checkFork(self):
+        # pymongo clients are not fork safe: a forked worker has to open its own pools.
+        if self.pid != os.getpid():
+            self.clients = {}
+            self.handles = {}
+            self.pid = os.getpid()
+
+    def getClient(self, link = None, username = None, password = None, authSource = None):
+        """
+        Returns the pooled client for the given connection, creating it on first use
+        :return: (key, client) tuple, key is used to look up cached handles
+        """
+        key = (link, username, password, authSource)
+        with self.lock:
+            self._checkFork()
+            if key not in self.clients:
+                options = {}
+                for option in self.options:
+                    if self.options[option] is not None:
+                        options[option] = self.options[option]
+                self.clients[key] = pymongo.MongoClient(link, username = username, password = password,
+                                                        authSource = authSource,
+                                                        event_listeners = [self.metrics], **options)
+            return key, self.clients[key]
+
+    def getDatabase(self, key, database_name):
+        """
+        Returns the cached database handle of a pooled client
+        """
+        with self.lock:
+            handle_key = key + (database_name,)
+            if handle_key not in self.handles:
+                self.handles[handle_key] = self.clients[key][database_name]
+            return self.handles[handle_key]
+
+    def getCollection(self, key, database_name, collection_name):
+        """
+        Returns the cached collection handle of a pooled client
+        """
+        with self.lock:
+            handle_key = key + (database_name, collection_name)
+            if handle_key not in self.handles:
+                self.handles[handle_key] = self.getDatabase(key, database_name)[collection_name]
+            return self.handles[handle_key]
+
+    def stats(self):
+        """
+        Pool statistics for monitoring
+        :return: dict with the client options, number of clients / cached handles and checkout metrics
+        """
+        with self.lock:
+            res = {
+                "clients": len(self.clients),
+                "cached_handles": len(self.handles),
+                "options": dict(self.options)
+            }
+        res["pool"] = self.metrics.snapshot()
+        return res
+
+    def closeAll(self):
+        """
+        Close all pooled clients. Called on interpreter shutdown.
+        """
+        with self.lock:
+            if self.pid == os.getpid():
+                for key in self.clients:
+                    self.clients[key].close()
+            self.clients = {}
+            self.handles = {}
+
+
+clientRegistry = MongoClientRegistry()
+atexit.register(clientRegistry.closeAll)
+
+
+class IndexManager:
+    """
+    Ensures the indexes needed by the access patterns of the APIs, based on the table naming scheme:
+    - raw_... and results_... tables: (idname, timestamp) for lookups by device and time windows
+    - ..._model_... tables: (idname, _id) for the latest model of a device (_id grows with creation time)
+    idname is the id field of the table given by the writer (e.g. "ID" or "deviceID"), there is no default
+    because generic tables do not share one. Indexes are created once per table and process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ensured = set()
+
+    def tableKind(self, collection_name):
+        """
+        :return: "raw", "results", "model" or None for other tables
+        """
+        if "_model_" in collection_name:
+            return "model"
+        elif collection_name.startswith("raw_"):
+            return "raw"
+        elif collection_name.startswith("results_"):
+            return "results"
+        return None
+
+    def indexSpecs(self, collection_name, idname, timeField = "timestamp"):
+        """
+        :return: list of index key lists for the given table
+        """
+        kind = self.tableKind(collection_name)
+        if kind == "model":
+            return [[(idname, pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]]
+        elif kind in ["raw", "results"]:
+            return [[(idname, pymongo.ASCENDING), (timeField, pymongo.ASCENDING)]]
+        return []
+
+    def ensureIndexes(self, mdbobject, idname, timeField = "timestamp"):
+        """
+        Create the indexes of the table of mdbobject if not done yet in this process
+        :return: list of created / existing index names
+        """
+        key = (mdbobject.clientKey, mdbobject.database_name, mdbobject.collection_name, idname, timeField)
+        with self.lock:
+            if key in self.ensured:
+                return []
+
+        names = []
+        for keys in self.indexSpecs(mdbobject.collection_name, idname, timeField):
+            names.append(mdbobject.collection.create_index(keys))
+
+        with self.lock:
+            self.ensured.add(key)
+        return names
+
+    def forget(self, clientKey, database_name, collection_name = None):
+        """
+        Forget ensured indexes of a dropped table (or of all tables of a dropped database)
+        """
+        with self.lock:
+            for key in list(self.ensured):
+                if key[0] == clientKey and key[1] == database_name and \
+                        (collection_name is None or key[2] == collection_name):
+                    self.ensured.discard(key)
+
+
+indexManager = IndexManager()
+
 
 class MongoDBAPI:
 
     def __init__(self,link = None, username= None, password = None, db = None):
         """
-        Define client for object
+        Define client for object. The client is taken from the process-wide clientRegistry.
         :param link: MongoDB link for connection
         """
-        self.client = pymongo.MongoClient(link, username = username, password = password, authSource = db)   # By default, DB is created on localhost port 27017
+        self.clientKey, self.client = clientRegistry.getClient(link, username, password, db)   # By default, DB is created on localhost port 27017
 
 
     def defineDB(self, database_name = "database"):
@@ -26,7 +276,7 @@ class MongoDBAPI:
         :param database_name: Name of the database
         """
         self.database_name = database_name
-        self.database = self.client[database_name]
+        self.database = clientRegistry.getDatabase(self.clientKey, database_name)
 
 
     def defineCollection(self,collection_name = "collection"):
@@ -36,7 +286,7 @@ class MongoDBAPI:
         :param collection_name:
         """
         self.collection_name = collection_name                  # Save name for future use
-        self.collection = self.database[self.collection_name]   # Define collection with this name
+        self.collection = clientRegistry.getCollection(self.clientKey, self.database_name, self.collection_name)   # Define collection with this name
 
 
     def checkCollectionExists(self):
@@ -57,6 +307,7 @@ class MongoDBAPI:
 
         """
         self.collection.drop()
+        indexManager.forget(self.clientKey, self.database_name, self.collection_name)
         return True
 
     def dropDatabase(self):
@@ -64,6 +315,7 @@ class MongoDBAPI:
         Drop database
 
         """
+        indexManager.forget(self.clientKey, self.database_name)
         if (self.client.drop_database(self.database_name) == True):
             self.collection = None
             self.database = None
@@ -91,13 +343,14 @@ class MongoDBAPI:
             return False
 
 
-    def insertRecords(self,records):
+    def insertRecords(self,records, ordered = True):
         """
         Insert multiple (JSON) records in the collection.
         :param records: JSON object with records
+        :param ordered: if False, the server may insert the records in parallel and continues after a failed one
         """
         try:
-            result = self.collection.insert_many(records)
+            result = self.collection.insert_many(records, ordered = ordered)
             print("Insert Successful")
             return True
 
@@ -106,15 +359,59 @@ class MongoDBAPI:
             return False
 
 
-    def findRecord(self, findQuery={}, maskingquery = {'_id': False}):
+    def buildQuery(self, findQuery={}, timeField = "timestamp", fromTime = None, toTime = None):
+        """
+        Add time bounds to a query
+        :param findQuery: SON object stating what you want in the table.
+        :param timeField: name of the timestamp field
+        :param fromTime: only records with timeField >= fromTime. No lower bound if None.
+        :param toTime: only records with timeField <= toTime. No upper bound if None.
+        :return: new query. A condition of findQuery on timeField is kept and combined with the bounds.
+        """
+        query = dict(findQuery)
+        if fromTime is not None or toTime is not None:
+            bounds = {}
+            if fromTime is not None:
+                bounds["$gte"] = fromTime
+            if toTime is not None:
+                bounds["$lte"] = toTime
+            if timeField in query:
+                return {"$and": [query, {timeField: bounds}]}
+            query[timeField] = bounds
+        return query
+
+
+    def buildProjection(self, properties = None, maskingquery = {'_id': False}):
+        """
+        Projection returning only the given properties
+        :param properties: list of field names. If None, maskingquery is returned as it is.
+        :param maskingquery: only its '_id' entry is kept when properties are given
+        :return: projection
+        """
+        if properties is None:
+            return maskingquery
+        projection = {}
+        for prop in properties:
+            projection[prop] = True
+        if '_id' in maskingquery:
+            projection['_id'] = maskingquery['_id']
+        return projection
+
+
+    def findRecord(self, findQuery={}, maskingquery = {'_id': False}, properties = None, timeField = "timestamp",
+                   fromTime = None, toTime = None):
         """
         Find multiple records
         :param findQuery: SON object stating what you want in the table. eg: { id : 1} means all the records with id = 1
         :param maskingquery: SON object stating what you want to omit from the results. By Default, omit '_id' from results.
+        :param properties: if given, only these fields are fetched
+        :param timeField, fromTime, toTime: optional time window, see buildQuery
         :return: list containing all the table values
         """
         try:
-            res =  list(self.collection.find(findQuery, projection = maskingquery))
+            query = self.buildQuery(findQuery, timeField, fromTime, toTime)
+            projection = self.buildProjection(properties, maskingquery)
+            res =  list(self.collection.find(query, projection = projection))
             if res:
                 print("Find Success")
                 return res
@@ -126,6 +423,20 @@ class MongoDBAPI:
             print("An error occured:" + str(e))
 
 
+    def iterRecords(self, findQuery={}, maskingquery = {'_id': False}, batchSize = 1000, limit = 0, sort = None):
+        """
+        Iterate over records without loading them all in memory
+        :param findQuery: SON object stating what you want in the table.
+        :param maskingquery: projection of the returned fields
+        :param batchSize: number of records fetched from the server per round trip
+        :param limit: maximum number of records, 0 means no limit
+        :param sort: list of (key, direction) pairs
+        :return: pymongo cursor
+        """
+        return self.collection.find(findQuery, projection = maskingquery, batch_size = batchSize,
+                                    limit = limit, sort = sort)
+
+
     def findLatestRecord(self, findQuery={}, maskingquery = {'_id': False}):
         """
         Find one latest record
@@ -163,3 +474,61 @@ class MongoDBAPI:
         except Exception as e:
             print("An error occured:" + str(e))
             return False
+
+
+    def ensureIndexes(self, idname, timeField = "timestamp"):
+        """
+        Ensure the standard indexes of this table, see IndexManager
+        :param idname: id field of the table, e.g. "ID" or "deviceID"
+        :return: list of index names
+        """
+        try:
+            return indexManager.ensureIndexes(self, idname, timeField)
+
+        except Exception as e:
+            print("An error occured:" + str(e))
+            return []
+
+
+    def listIndexes(self):
+        """
+        :return: list of indexes as dicts with name, key (list of [field, direction]) and options
+        """
+        res = []
+        for index in self.collection.list_indexes():
+            index = dict(index)
+            index["key"] = [[field, direction] for field, direction in index["key"].items()]
+            res.append(index)
+        return res
+
+
+    def createIndex(self, keys, name = None, unique = False):
+        """
+        Create an index
+        :param keys: list of [field, direction] pairs, direction 1 or -1
+        :return: name of the index
+        """
+        options = {"unique": unique}
+        if name is not None:
+            options["name"] = name
+        return self.collection.create_index([(str(field), int(direction)) for field, direction in keys], **options)
+
+
+    def dropIndex(self, name):
+        """
+        Drop the index with the given name
+        """
+        self.collection.drop_index(name)
+        indexManager.forget(self.clientKey, self.database_name, self.collection_name)
+        return True
+
+
+    def indexUsage(self):
+        """
+        Usage counters of the indexes since server start ($indexStats)
+        :return: dict of index name to number of operations that used it
+        """
+        res = {}
+        for stat in self.collection.aggregate([{"$indexStats": {}}]):
+            res[stat["name"]] = stat["accesses"]["ops"]
+        return res
@@ -1,5 +1,8 @@
+import os
+import time
 import numpy as np
 import random
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
 import matplotlib.font_manager
 
@@ -19,11 +22,15 @@ class KNN(object):
         self.p = 2
         self.metric_params = None
         self.n_jobs = 1
+        # number of test points scored per KDTree query
+        self.chunk_size = 10000
 
     def fit(self, data, n_neighbors=5, leaf_size=30):
         """function to fit the model
         - threshold: used to decide the binary label
         - labels_: binary labels of training data
+        The decision scores of the training data and the threshold are computed once here
+        and kept in self.decision_scores_ and self.threshold_ to be stored with the model.
         :return: self
         :rtype: object
         """
@@ -46,6 +53,10 @@ class KNN(object):
         # model fitting
         clf.fit(data)
 
+        self.n_neighbors = int(n_neighbors)
+        self.leaf_size = int(leaf_size)
+        self.threshold_ = self._threshold_calculation(clf)
+
         return clf, tree_
 
     def testset_generation(self, data):
@@ -88,13 +99,77 @@ class KNN(object):
         elif self.method == 'median':
             dist = np.median(dist_arr, axis=1)
 
-        decision_scores_ = dist.ravel()
-        threshold_ = scoreatpercentile(decision_scores_, 100)
+        self.decision_scores_ = dist.ravel()
+        threshold_ = scoreatpercentile(self.decision_scores_, 100)
 
         return threshold_
 
-    def _decision_function(self, tree_, data):
+    def upgrade(self, pickledDict):
+        """function to add the threshold to a model saved before it was computed at training time
+        The model dict is updated in place, so a cached model is only upgraded once.
+        :return: pickledDict
+        :rtype: dict
+        """
+        if 'threshold' not in pickledDict:
+            params = pickledDict['clf'].get_params()
+            self.n_neighbors = int(params['n_neighbors'])
+            threshold_ = self._threshold_calculation(pickledDict['clf'])
+            pickledDict['decision_scores'] = self.decision_scores_
+            pickledDict['method'] = self.method
+            pickledDict['threshold'] = threshold_
+
+        return pickledDict
+
+    def _distance_score(self, dist_arr):
+        """function to reduce the distances to the k nearest neighbors (one row per point) to a score
+        :return: array of scores
+        """
+        if self.method == 'largest':
+            # the last one: largest distance
+            return dist_arr[:, -1]
+        # calculate the mean of each row
+        elif self.method == 'mean':
+            return np.mean(dist_arr, axis=1)
+        elif self.method == 'median':
+            return np.median(dist_arr, axis=1)
+
+    def _decision_function(self, tree_, data, chunk_size=None, n_jobs=None):
         """function to calculate the decision score for testset
+        The KDTree is queried for whole chunks of the testset at once, the chunks are
+        distributed over n_jobs threads.
+        :param chunk_size: number of points per query, self.chunk_size if None
+        :param n_jobs: number of threads, self.n_jobs if None (-1: one per CPU)
+        :return: list of scores
+        :rtype: float
+        """
+        data = check_array(data)
+
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        if n_jobs is None:
+            n_jobs = self.n_jobs
+        if n_jobs < 0:
+            n_jobs = os.cpu_count() or 1
+
+        def score_chunk(start):
+            # get the distance between the data points and their k nearest neighbors
+            dist_arr, _ = tree_.query(data[start:start + chunk_size], k=self.n_neighbors)
+            return self._distance_score(dist_arr)
+
+        starts = range(0, data.shape[0], max(1, int(chunk_size)))
+        if n_jobs > 1 and len(starts) > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                pred_scores = list(executor.map(score_chunk, starts))
+        else:
+            pred_scores = [score_chunk(start) for start in starts]
+
+        if not pred_scores:
+            return np.zeros(0)
+        return np.concatenate(pred_scores).ravel()
+
+    def _decision_function_loop(self, tree_, data):
+        """reference implementation of _decision_function querying the KDTree point by point
+        Only used by the benchmark below.
         :return: list of scores
         :rtype: float
         """
@@ -110,33 +185,30 @@ class KNN(object):
             # get the distance between the current data point and its k nearest neighbors
             dist_arr, _ = tree_.query(x_i, k=self.n_neighbors)
 
-            if self.method == 'largest':
-                dist = dist_arr[:, -1]
-            # calculate the mean of each row
-            elif self.method == 'mean':
-                dist = np.mean(dist_arr, axis=1)
-            elif self.method == 'median':
-                dist = np.median(dist_arr, axis=1)
-
-            # the last one: largest distance
-            pred_score_i = dist[-1]
-
             # record the current item
-            pred_scores[i, :] = pred_score_i
+            pred_scores[i, :] = self._distance_score(dist_arr)[-1]
 
         return pred_scores.ravel()
 
 
-    def predict(self, clf, tree_, testset):
+    def predict(self, clf, tree_, testset, threshold_=None, method=None):
+        """function to predict the binary labels of the testset
+        :param threshold_: threshold stored with the model. Calculated from the training data if None.
+        :param method: method the threshold was calculated with
+        :return: 1 for normal, 0 for novel points
+        """
         print ("Model predicting...")
 
         params = clf.get_params()
 
         self.n_neighbors = int(params['n_neighbors'])
         self.leaf_size = int(params['leaf_size'])
+        if method is not None:
+            self.method = method
 
         pred_score = self._decision_function(tree_, testset)
-        threshold_ = self._threshold_calculation(clf)
+        if threshold_ is None:
+            threshold_ = self._threshold_calculation(clf)
         y_pred_test =  (pred_score <= threshold_).astype('int').ravel()
         
         return y_pred_test
@@ -201,4 +273,40 @@ class KNN(object):
         plt.savefig('knn.png')
         # plt.show()
 
-        return 0
\ No newline at end of file
+        return 0
+
+
+def benchmark(n_train=10000, n_test=20000, n_neighbors=5, leaf_size=30, n_jobs=4):
+    """Compares the point by point scoring with the batched scoring on random data
+    Run with: python3 -m PMmodels.knn
+    :return: dict of timings in seconds
+    """
+    rng = np.random.RandomState(0)
+    trainset = rng.normal(size=(n_train, 2))
+    testset = rng.uniform(-4, 4, size=(n_test, 2))
+
+    model = KNN()
+    clf, tree_ = model.fit(trainset, n_neighbors, leaf_size)
+    model.n_neighbors = n_neighbors
+
+    timings = {}
+    start = time.time()
+    loop_scores = model._decision_function_loop(tree_, testset)
+    timings['loop'] = time.time() - start
+
+    start = time.time()
+    batch_scores = model._decision_function(tree_, testset, n_jobs=1)
+    timings['batch'] = time.time() - start
+
+    start = time.time()
+    threaded_scores = model._decision_function(tree_, testset, chunk_size=max(1, n_test // n_jobs), n_jobs=n_jobs)
+    timings['batch_%d_threads' % n_jobs] = time.time() - start
+
+    assert np.allclose(loop_scores, batch_scores) and np.allclose(loop_scores, threaded_scores)
+    for name, sec in timings.items():
+        print("%-20s %8.3f s  (%.1fx)" % (name, sec, timings['loop'] / sec))
+    return timings
+
+
+if __name__ == '__main__':
+    benchmark()
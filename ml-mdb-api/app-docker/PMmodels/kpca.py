@@ -1,5 +1,7 @@
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA, KernelPCA
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import Ridge
 import numpy as np
 from numpy import linalg as la
 import random
@@ -7,9 +9,64 @@ import matplotlib.pyplot as plt
 import matplotlib.font_manager
 
 
+class ApproxKernelPCA(object):
+    """Approximate rbf kernel PCA for large datasets
+
+    The data is mapped to n_landmarks features approximating the rbf kernel (Nystroem landmarks
+    or random Fourier features), followed by a linear PCA. The inverse transform is a ridge
+    regression from the components back to the data. Memory and time are linear in the number
+    of rows instead of quadratic / cubic for KernelPCA.
+    Provides transform and inverse_transform like KernelPCA.
+    """
+
+    def __init__(self, n_components=100, alpha=0.3, gamma=4, n_landmarks=500, approximation="nystroem",
+                 random_state=0):
+        self.n_components = n_components
+        self.alpha = alpha
+        self.gamma = gamma
+        self.n_landmarks = n_landmarks
+        self.approximation = approximation
+        self.random_state = random_state
+
+    def fit(self, data):
+        n_landmarks = min(int(self.n_landmarks), len(data))
+        if self.approximation == "nystroem":
+            self.feature_map_ = Nystroem(kernel="rbf", gamma=self.gamma, n_components=n_landmarks,
+                                         random_state=self.random_state)
+        elif self.approximation == "rff":
+            self.feature_map_ = RBFSampler(gamma=self.gamma, n_components=n_landmarks,
+                                           random_state=self.random_state)
+        else:
+            raise ValueError("Unknown kernel approximation %s (Only supports nystroem or rff)." % self.approximation)
+
+        features = self.feature_map_.fit_transform(data)
+        self.pca_ = PCA(n_components=min(self.n_components, n_landmarks, len(data)))
+        X_transformed = self.pca_.fit_transform(features)
+
+        # learned inverse map, alpha is the ridge regularization as for KernelPCA
+        self.inverse_map_ = Ridge(alpha=self.alpha).fit(X_transformed, data)
+        return self
+
+    def transform(self, data):
+        return self.pca_.transform(self.feature_map_.transform(data))
+
+    def inverse_transform(self, X_transformed):
+        return self.inverse_map_.predict(X_transformed)
+
+
 class KPCA(object):
 
-    def fit(self, data, alpha=0.3, gamma=4):
+    def __init__(self):
+        # number of points transformed at once, bounds the memory of the kernel matrices
+        self.chunk_size = 5000
+
+    def fit(self, data, alpha=0.3, gamma=4, n_landmarks=0, approximation="nystroem"):
+        """function to fit the model
+        :param n_landmarks: 0 fits the exact KernelPCA. Otherwise an ApproxKernelPCA with this number of
+                            Nystroem landmarks / random Fourier features is fitted.
+        :param approximation: "nystroem" or "rff"
+        :return: model, scaler and the maximum reconstruction error of the training data
+        """
         scaler = StandardScaler().fit(data)
         data = scaler.transform(data)
 
@@ -19,16 +76,31 @@ class KPCA(object):
         
         print ("Model fitting...")
 
-        clf = KernelPCA(n_components = 100, kernel="rbf", fit_inverse_transform=True, alpha=alpha, gamma=gamma)
+        if int(n_landmarks) > 0:
+            clf = ApproxKernelPCA(n_components = 100, alpha=alpha, gamma=gamma, n_landmarks=int(n_landmarks),
+                                  approximation=approximation)
+        else:
+            clf = KernelPCA(n_components = 100, kernel="rbf", fit_inverse_transform=True, alpha=alpha, gamma=gamma)
         clf.fit(data)
         max_err = self._err_calc(clf, data).max()
 
         return clf, scaler, max_err
 
-    def _err_calc(self, clf, data):
-        X_kpca = clf.transform(data)
-        X_back = clf.inverse_transform(X_kpca)
-        loss=la.norm(data - X_back,axis=1)
+    def _err_calc(self, clf, data, chunk_size=None):
+        """function to calculate the reconstruction error of each point
+        The points are transformed in chunks of chunk_size (self.chunk_size if None).
+        :return: array of errors
+        """
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        data = np.asarray(data)
+
+        loss = np.empty(len(data))
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            X_kpca = clf.transform(chunk)
+            X_back = clf.inverse_transform(X_kpca)
+            loss[start:start + chunk_size] = la.norm(chunk - X_back, axis=1)
 
         return loss
 
@@ -54,22 +126,20 @@ class KPCA(object):
         return X_test
 
 
-    def predict(self, clf, scaler, max_err, data):
+    def predict(self, clf, scaler, max_err, data, return_scores=False):
+        """function to predict the binary labels of the data
+        :param return_scores: also return the reconstruction errors (the anomaly scores)
+        :return: 1 for normal, 0 for novel points (and the errors if return_scores)
+        """
         print ("Model predicting...")
 
         data = scaler.transform(data)
         error = self._err_calc(clf, data)
+        y_pred_test = (error <= max_err).astype('int')
 
-        length = len(data)
-        y_pred_test = []
-
-        for i in range(length):
-            if error[i] > max_err:
-                y_pred_test.append(0)
-            else:
-                y_pred_test.append(1)
-        
-        return np.array(y_pred_test)
+        if return_scores:
+            return y_pred_test, error
+        return y_pred_test
 
     def visualization(self, clf, scaler, max_err, trainset, predicted_testset):
         print ("Calculating decision boundaries...")
@@ -97,14 +167,8 @@ class KPCA(object):
         xx, yy = np.meshgrid(np.arange(x_min, x_max, step_x),
                              np.arange(y_min, y_max, step_y))
 
-        err = np.zeros([m//2,m])
-
-        for i in range(m//2):
-            for j in range(m):
-                x_in = np.array([xx[0,j],yy[i,0]])
-                err[i,j] = self._err_calc(clf, x_in.reshape(1, -1))
-
-        Z = err
+        # all grid points are transformed at once (in chunks)
+        Z = self._err_calc(clf, np.c_[xx.ravel(), yy.ravel()]).reshape(xx.shape)
 
         print ("Plotting graphs...\n")        
         plt.figure(figsize=(12,9))
@@ -1,17 +1,136 @@
+import time
 import numpy as np
 import random
 import matplotlib.pyplot as plt
 import matplotlib.font_manager
 from sklearn import svm
+from sklearn.kernel_approximation import Nystroem
+
+
+class ApproxOneClassSVM(object):
+    """Approximate rbf one class SVM for large datasets
+
+    The data is mapped to n_landmarks Nystroem features approximating the rbf kernel and a linear
+    one class SVM is trained on them with mini-batch stochastic subgradient descent (Pegasos steps).
+    The offset rho is eliminated from the primal problem: for a given w it is the nu-quantile of
+    the scores, so every step follows the nu fraction of the batch with the lowest scores.
+    Time and memory are linear in the number of rows.
+    Provides predict and decision_function like svm.OneClassSVM.
+    """
+
+    def __init__(self, nu=0.5, gamma=0.1, n_landmarks=300, n_iter=2000, batch_size=1024, random_state=0):
+        self.nu = nu
+        self.gamma = gamma
+        self.n_landmarks = n_landmarks
+        self.n_iter = n_iter
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    def fit(self, data):
+        data = np.asarray(data, dtype=float)
+        rng = np.random.RandomState(self.random_state)
+
+        self.feature_map_ = Nystroem(kernel="rbf", gamma=self.gamma, n_components=min(int(self.n_landmarks), len(data)),
+                                     random_state=self.random_state)
+        features = self.feature_map_.fit_transform(data)
+
+        batch_size = min(int(self.batch_size), len(features))
+        k = max(1, int(np.ceil(self.nu * batch_size)))
+        w = np.zeros(features.shape[1])
+        for t in range(1, int(self.n_iter) + 1):
+            batch = features[rng.randint(0, len(features), batch_size)]
+            lowest = np.argpartition(batch.dot(w), k - 1)[:k]
+            # step 1/(nu*t) on nu/2*|w|^2 - mean of the k lowest scores
+            w = (1.0 - 1.0 / t) * w + batch[lowest].sum(axis=0) / (self.nu * batch_size * t)
+
+        self.coef_ = w
+        self.offset_ = np.percentile(features.dot(w), 100 * self.nu)
+        return self
+
+    def decision_function(self, data):
+        return self.feature_map_.transform(np.asarray(data, dtype=float)).dot(self.coef_) - self.offset_
+
+    def predict(self, data):
+        return np.where(self.decision_function(data) >= 0, 1, -1)
+
 
 class OCSVM(object):
 
+    def __init__(self):
+        # training options for large tables, see fit
+        self.max_rows = 0
+        self.sampling = "time"
+        self.solver = "libsvm"
+        self.n_landmarks = 300
+        # rows, fit time and support vector count of the last fit
+        self.fit_info_ = {}
+
     def fit(self, data, nu, gamma):
+        """function to fit the model
+        - max_rows: if > 0, larger datasets are subsampled to max_rows rows (see subsample)
+        - solver: "libsvm" trains svm.OneClassSVM, "sgd" trains an ApproxOneClassSVM with n_landmarks features
+        :return: model
+        """
         print ("Model fitting...")
-        clf = svm.OneClassSVM(nu = nu, kernel="rbf", gamma = gamma) # This setting can work at manually thicked data
+        start = time.time()
+        data = np.asarray(data, dtype=float)
+        n_rows = len(data)
+        if self.max_rows and n_rows > self.max_rows:
+            data = self.subsample(data, int(self.max_rows), self.sampling)
+
+        if self.solver == "sgd":
+            clf = ApproxOneClassSVM(nu = nu, gamma = gamma, n_landmarks = self.n_landmarks)
+        elif self.solver == "libsvm":
+            clf = svm.OneClassSVM(nu = nu, kernel="rbf", gamma = gamma) # This setting can work at manually thicked data
+        else:
+            raise ValueError("Unknown solver %s (Only supports libsvm or sgd)." % self.solver)
         clf.fit(data)
+
+        self.fit_info_ = {
+            "solver": self.solver,
+            "rows": n_rows,
+            "rows_used": len(data),
+            "fit_time": time.time() - start,
+            # the Nystroem landmarks play the role of the support vectors for the sgd solver
+            "n_support": int(len(clf.support_)) if self.solver == "libsvm" else int(len(clf.feature_map_.component_indices_))
+        }
+        print ("Fitted on %d of %d rows in %.2f s, %d support vectors" % (len(data), n_rows, self.fit_info_["fit_time"],
+                                                                         self.fit_info_["n_support"]))
         return clf
 
+    def subsample(self, data, max_rows, sampling="time"):
+        """function to reduce the training data to max_rows rows
+        - "time": evenly spaced rows in the stored (time) order
+        - "stratified": rows drawn from each cell of a quantile grid over the features in proportion
+                        to its size (at least one per cell as far as max_rows allows), so sparse regions are kept
+        - "random": uniform random rows
+        :return: subsampled data
+        """
+        if sampling == "time":
+            index = np.linspace(0, len(data) - 1, max_rows).astype(int)
+        elif sampling == "random":
+            index = np.sort(np.random.RandomState(0).choice(len(data), max_rows, replace=False))
+        elif sampling == "stratified":
+            rng = np.random.RandomState(0)
+            bins = 10
+            cell = np.zeros(len(data), dtype=int)
+            for j in range(data.shape[1]):
+                edges = np.unique(np.percentile(data[:, j], np.linspace(0, 100, bins + 1)[1:-1]))
+                cell = cell * bins + np.searchsorted(edges, data[:, j])
+            cells, inverse, counts = np.unique(cell, return_inverse=True, return_counts=True)
+            # largest-remainder allocation of exactly max_rows rows, the leftover rows go to the
+            # empty cells first, then to the cells with the largest remainders
+            quota = counts * float(max_rows) / len(data)
+            take = np.floor(quota).astype(int)
+            order = np.lexsort((take - quota, take > 0))
+            take[order[:max_rows - take.sum()]] += 1
+            index = np.sort(np.concatenate([rng.choice(np.flatnonzero(inverse == i), take[i], replace=False)
+                                            for i in range(len(cells))]))
+        else:
+            raise ValueError("Unknown sampling %s (Only supports time, stratified or random)." % sampling)
+
+        return data[index]
+
     def testset_generation(self, data):
         # select specific columns from the loaded table
         print ("Testset_generating...")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+"""
+Moving average smoothing of prediction results per device and model
+
+Each (database, model table, deviceID) has its own ring buffer of the last `window` results (1 normal,
+0 anomaly) with a running sum, so adding a result and reading the average are O(1).
+The buffers can be persisted in the table "smoothing_state" of the database to survive restarts.
+"""
+
+import threading
+
+import ChariotCloudAPI
+
+STATE_TABLE = "smoothing_state"
+
+
+class RingBuffer(object):
+    """
+    Fixed-size buffer of the last `size` values with their running sum
+    """
+
+    def __init__(self, size):
+        self.size = int(size)
+        self.values = [0] * self.size
+        self.pos = 0
+        self.count = 0
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        if self.count == self.size:
+            self.total -= self.values[self.pos]
+        else:
+            self.count += 1
+        self.values[self.pos] = value
+        self.total += value
+        self.pos = (self.pos + 1) % self.size
+
+    def full(self):
+        return self.count == self.size
+
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0.0
+
+    def toDict(self):
+        return {"size": self.size, "values": list(self.values), "pos": self.pos, "count": self.count}
+
+    @classmethod
+    def fromDict(cls, state):
+        buffer = cls(state["size"])
+        buffer.values = list(state["values"])
+        buffer.pos = int(state["pos"])
+        buffer.count = int(state["count"])
+        buffer.total = sum(buffer.values)
+        return buffer
+
+
+class ResultSmoother(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffers = {}
+
+    def smooth(self, database, model_table, deviceID, curr_result, window = 1, weight = 0.4, persist = False):
+        """
+        Adds a prediction result to the buffer of the device and model
+        :param curr_result: 1.0 for normal data, anything else is an anomaly
+        :param window: number of results averaged. 1 disables the smoothing.
+        :param weight: an anomaly is detected if the fraction of normal results in the window is below weight
+        :param persist: load the buffer from and save it to the database
+        :return: True if an anomaly is detected. False until the window is filled.
+        """
+        if int(window) <= 1:
+            return curr_result != 1.0
+
+        key = (database, model_table, str(deviceID))
+        with self.lock:
+            buffer = self._buffer(key, int(window))
+        if buffer is None:
+            # The stored state is read without holding the lock, so other devices are not blocked
+            loaded = self._load(key, int(window)) if persist else None
+            with self.lock:
+                # Another request of the device may have created the buffer in the meantime
+                buffer = self._buffer(key, int(window))
+                if buffer is None:
+                    buffer = loaded if loaded is not None else RingBuffer(window)
+                    self.buffers[key] = buffer
+
+        with buffer.lock:
+            buffer.add(1 if curr_result == 1.0 else 0)
+            anomaly_detected = buffer.full() and buffer.mean() < weight
+            if persist:
+                self._save(key, buffer)
+
+        return anomaly_detected
+
+    def _buffer(self, key, window):
+        """
+        The caller holds self.lock
+        :return: the buffer of key if it has the given window, else None
+        """
+        buffer = self.buffers.get(key)
+        return buffer if buffer is not None and buffer.size == window else None
+
+    def _load(self, key, window):
+        try:
+            mdbobject = ChariotCloudAPI.makeObject(dbName = key[0], dbCollection = STATE_TABLE)
+            state = mdbobject.collection.find_one({"model_table": key[1], "deviceID": key[2]}, projection = {'_id': 0})
+            if state is None or int(state["size"]) != window:
+                return None
+            return RingBuffer.fromDict(state)
+
+        except Exception as e:
+            print("Error loading the smoothing state: " + str(e))
+            return None
+
+    def _save(self, key, buffer):
+        try:
+            mdbobject = ChariotCloudAPI.makeObject(dbName = key[0], dbCollection = STATE_TABLE)
+            state = buffer.toDict()
+            state["model_table"] = key[1]
+            state["deviceID"] = key[2]
+            mdbobject.collection.replace_one({"model_table": key[1], "deviceID": key[2]}, state, upsert = True)
+
+        except Exception as e:
+            print("Error saving the smoothing state: " + str(e))
+
+    def clear(self):
+        with self.lock:
+            self.buffers.clear()
+
+
+resultSmoother = ResultSmoother()
@@ -3,3 +3,4 @@ from .individual import IndividualBase
 from .decimal_individual import DecimalIndividual
 from .floating_point_individual import FloatingPointIndividual
 from .population import Population
+from .array_population import ArrayPopulation
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' Population with all chromsomes stored in one NumPy array. '''
+
+import numpy as np
+
+from .individual import IndividualBase
+from .floating_point_individual import FloatingPointIndividual
+from .population import Population
+
+
+def _detached(indv):
+    '''
+    Unpickles an IndividualView as the detached individual it was pickled as.
+    '''
+    return indv
+
+
+class ChromsomeRow(list):
+    '''
+    List copy of one row of the chromsome array. Item assignments are written
+    through to the array, so operators changing an individual in place keep
+    working. Copies are plain lists.
+    '''
+    def __init__(self, population, index):
+        super(ChromsomeRow, self).__init__(population.chromsomes[index].tolist())
+        self._population = population
+        self._index = index
+
+    def __setitem__(self, key, value):
+        super(ChromsomeRow, self).__setitem__(key, value)
+        self._population.chromsomes[self._index, key] = value
+        self._population.update_flag()
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return list(self)
+
+
+class IndividualView(IndividualBase):
+    '''
+    Light-weight individual referring to one row of an ArrayPopulation.
+    '''
+    def __init__(self, population, index):
+        # All attributes except the chromsome are taken from the population
+        # template, the view itself only stores its row.
+        self.population = population
+        self.index = index
+
+    @property
+    def ranges(self):
+        return self.population.indv_template.ranges
+
+    @property
+    def eps(self):
+        return self.population.indv_template.eps
+
+    @property
+    def precisions(self):
+        return self.population.indv_template.precisions
+
+    @property
+    def power_type(self):
+        return self.population.indv_template.power_type
+
+    @property
+    def pi(self):
+        return self.population.indv_template.pi
+
+    @property
+    def torque(self):
+        return self.population.indv_template.torque
+
+    @property
+    def chromsome(self):
+        return ChromsomeRow(self.population, self.index)
+
+    @chromsome.setter
+    def chromsome(self, chromsome):
+        self.population.chromsomes[self.index] = chromsome
+        self.population.update_flag()
+
+    # The chromsome of a FloatingPointIndividual is its solution.
+    solution = chromsome
+
+    def init(self, chromsome=None, solution=None):
+        self.chromsome = chromsome if chromsome is not None else solution
+        return self
+
+    def clone(self):
+        '''
+        Detached FloatingPointIndividual with a copy of the chromsome, created
+        without the random initialization of its constructor.
+        '''
+        template = self.population.indv_template
+        indv = template.__class__.__new__(template.__class__)
+        indv.power_type = template.power_type
+        indv.pi = template.pi
+        indv.torque = template.torque
+        indv.ranges = template.ranges
+        indv.eps = template.eps
+        indv.precisions = template.precisions
+        indv.chromsome = self.population.chromsomes[self.index].tolist()
+        indv.solution = indv.decode()
+        return indv
+
+    def __reduce__(self):
+        # Pickled (e.g. for worker processes) as a detached individual.
+        return (_detached, (self.clone(),))
+
+    def encode(self):
+        return self.solution
+
+    def decode(self):
+        return self.chromsome
+
+
+class ArrayPopulation(Population):
+
+    def __init__(self, indv_template, size=100):
+        '''
+        Population storing the chromsomes of all individuals in one array of
+        shape [size, genes] instead of a list of individual objects.
+
+        The individuals are light-weight views on the rows of the array, so the
+        population works with the GAEngine and all operators. Operators with
+        array implementations (select_batch, cross_batch, mutate_batch) let the
+        engine produce a whole generation with a few array operations.
+
+        :param indv_template: A FloatingPointIndividual providing the power
+                              type, ranges, interval and torque.
+
+        :param size: The size of population, number of individuals in population.
+        :type size: int
+        '''
+        if not isinstance(indv_template, FloatingPointIndividual):
+            raise TypeError('ArrayPopulation only supports FloatingPointIndividual')
+        super(ArrayPopulation, self).__init__(indv_template, size)
+
+        self._chromsomes = np.empty((0, len(indv_template.chromsome)))
+        self._views = None
+
+    @property
+    def chromsomes(self):
+        '''
+        Chromsomes of all individuals, array of shape [size, genes].
+        '''
+        return self._chromsomes
+
+    @chromsomes.setter
+    def chromsomes(self, chromsomes):
+        self._chromsomes = np.array(chromsomes, dtype=float)
+        self._views = None
+        self.update_flag()
+
+    @property
+    def individuals(self):
+        '''
+        Views on all rows of the chromsome array.
+        '''
+        if self._views is None:
+            self._views = [IndividualView(self, i) for i in range(len(self._chromsomes))]
+        return self._views
+
+    @individuals.setter
+    def individuals(self, indvs):
+        self.chromsomes = [list(indv.chromsome) for indv in indvs]
+
+    def init(self, indvs=None, rng=None):
+        '''
+        Initialize current population with individuals.
+
+        :param indvs: Initial individuals in population, randomly initialized
+                      individuals are created if not provided.
+        :type indvs: list of Individual object
+
+        :param rng: numpy RandomState for the random individuals, the
+                    numpy.random module by default.
+        '''
+        if indvs is None:
+            template = self.indv_template
+            IndvType = template.__class__
+            indvs = [IndvType(power_type=template.power_type, ranges=template.ranges,
+                              eps=template.eps, pi=template.pi, torque=template.torque, rng=rng)
+                     for _ in range(self.size)]
+        elif len(indvs) != self.size:
+            raise ValueError('Invalid individuals number')
+
+        self.individuals = indvs
+
+        return self
+
+    def solutions(self):
+        '''
+        Solutions of all individuals, the chromsome array itself.
+        '''
+        return self._chromsomes
+
+    def _chromsome_keys(self):
+        '''
+        Bytes of each chromsome row, the fitness cache keys.
+        '''
+        return [row.tobytes() for row in self._chromsomes]
+
+    def __len__(self):
+        '''
+        Get length of population.
+        '''
+        return len(self._chromsomes)
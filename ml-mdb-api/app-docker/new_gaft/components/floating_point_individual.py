@@ -14,7 +14,7 @@ from ..plugin_interfaces.functions.power_calculation_real import PowerCalculatio
 class FloatingPointIndividual(IndividualBase):
     ''' Individual with decimal encoding.
     '''
-    def __init__(self, power_type, ranges, eps=0.001, pi=2, torque=0):
+    def __init__(self, power_type, ranges, eps=0.001, pi=2, torque=0, rng=None):
         super(FloatingPointIndividual, self).__init__(power_type, ranges, eps, pi, torque)
 
         if power_type == 0:
@@ -27,7 +27,9 @@ class FloatingPointIndividual(IndividualBase):
         # historical training data
         min_speed = ranges[0][0]
         max_speed = ranges[0][1]
-        vmin_0 = ((uniform(min_speed, max_speed) - min_speed)//pi)*pi + min_speed
+        # rng: optional numpy RandomState
+        rand = uniform if rng is None else rng.uniform
+        vmin_0 = ((rand(min_speed, max_speed) - min_speed)//pi)*pi + min_speed
         vmax_0 = vmin_0 + pi
         pmin_0 = power_calc.calculation(vmin_0,torque)
         pmax_0 = power_calc.calculation(vmax_0,torque)
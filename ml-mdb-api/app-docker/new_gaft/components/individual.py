@@ -8,11 +8,14 @@ from copy import deepcopy
 class SolutionRanges(object):
     ''' Descriptor for solution ranges.
     '''
-    def __init__(self):
-        self.__ranges = []
+    def __init__(self, name):
+        # Stored in the individual, not shared by all individuals.
+        self.name = '_{}'.format(name)
 
     def __get__(self, obj, owner):
-        return self.__ranges
+        if obj is None:
+            return self
+        return obj.__dict__.get(self.name, [])
 
     def __set__(self, obj, ranges):
         # Check.
@@ -31,17 +34,20 @@ class SolutionRanges(object):
             if a >= b:
                 raise ValueError('Wrong range value {}'.format(rng))
         # Assignment.
-        self.__ranges = ranges
+        obj.__dict__[self.name] = ranges
 
 
 class DecretePrecision(object):
     ''' Descriptor for individual decrete precisions.
     '''
-    def __init__(self):
-        self.__precisions = []
+    def __init__(self, name):
+        # Stored in the individual, not shared by all individuals.
+        self.name = '_{}'.format(name)
 
     def __get__(self, obj, owner):
-        return self.__precisions
+        if obj is None:
+            return self
+        return obj.__dict__.get(self.name, [])
 
     def __set__(self, obj, precisions):
         if type(precisions) in [int, float]:
@@ -55,20 +61,20 @@ class DecretePrecision(object):
             if eps > (b - a):
                 msg = 'Invalid precision {} in range ({}, {})'.format(eps, a, b)
                 raise ValueError(msg)
-        self.__precisions = precisions
+        obj.__dict__[self.name] = precisions
 
 
 class IndividualBase(object):
     ''' Base class for individuals.
     '''
     # Solution ranges.
-    ranges = SolutionRanges()
+    ranges = SolutionRanges('ranges')
 
     # Original decrete precisions (provided by users).
-    eps = DecretePrecision()
+    eps = DecretePrecision('eps')
     
     # Actual decrete precisions used in GA.
-    precisions = DecretePrecision()
+    precisions = DecretePrecision('precisions')
 
     def __init__(self, power_type, ranges, eps, pi, torque):
         # self.real_time_list = real_time_list
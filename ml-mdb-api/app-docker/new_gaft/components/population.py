@@ -5,35 +5,6 @@ from .individual import IndividualBase
 import numpy as np
 
 
-class Memoized(object):
-    '''
-    Descriptor for population statistical varibles caching.
-    '''
-    def __init__(self, func):
-        self.func = func
-        self.result = None
-        self.fitness = None
-
-    def __get__(self, instance, cls):
-        self.instance = instance
-        return self
-
-    def __call__(self, fitness):
-        if ((not self.instance.updated)          # population not changed
-                and (self.result is not None)    # result already cached
-                and (fitness == self.fitness)):  # fitness not changed
-            # Return cached result directly.
-            return self.result
-        else:
-            # Update fitness function.
-            self.fitness = fitness
-            # Update and memoize result.
-            self.result = self.func(self.instance, fitness)
-            # Recover flag.
-            self.instance._updated = False
-            return self.result
-
-
 class Individuals(object):
     '''
     Descriptor for all individuals in population.
@@ -74,8 +45,19 @@ class Population(object):
         # Template individual.
         self.indv_template = indv_template
 
-        # Flag for monitoring changes of population.
+        # Flag and version number for monitoring changes of population.
         self._updated = False
+        self._version = 0
+
+        # Fitness cache per fitness function: (version, fitness value of each
+        # chromsome, fitness values of all individuals).
+        self._fits = {}
+
+        # Parallel backend for the fitness evaluation, set by a running GAEngine.
+        self.backend = None
+
+        # Rank order and the fitness values it was computed from.
+        self._rank_order, self._rank_fits = None, None
 
         # Container for all individuals.
         class IndvList(list):
@@ -87,16 +69,17 @@ class Population(object):
             # {{{
             # NOTE: Use 'this' here to avoid name conflict.
             def __init__(this, *args):
-                super(this.__class__, this).__init__(*args)
+                super(IndvList, this).__init__(*args)
 
             def __setitem__(this, key, value):
                 '''
                 Override __setitem__ in built-in list type.
                 '''
-                old_value = this[key]
-                if old_value == value:
+                # Identity, not equality: an equal but different individual
+                # still replaces the old one.
+                if this[key] is value:
                     return
-                super(this.__class__, self).__setitem__(key, value)
+                super(IndvList, this).__setitem__(key, value)
                 # Update population flag.
                 self.update_flag()
 
@@ -104,14 +87,14 @@ class Population(object):
                 '''
                 Override append method of built-in list type.
                 '''
-                super(this.__class__, this).append(item)
+                super(IndvList, this).append(item)
                 # Update population flag.
                 self.update_flag()
 
             def extend(this, iterable_item):
                 if not iterable_item:
                     return
-                super(this.__class__, this).extend(iterable_item)
+                super(IndvList, this).extend(iterable_item)
                 # Update population flag.
                 self.update_flag()
             # }}}
@@ -154,6 +137,7 @@ class Population(object):
         Interface for updating individual update flag to True.
         '''
         self._updated = True
+        self._version += 1
 
     @property
     def updated(self):
@@ -183,41 +167,59 @@ class Population(object):
         '''
         return len(self.individuals)
 
+    def best_index(self, fitness):
+        '''
+        Index of the individual with the best fitness.
+        '''
+        return int(np.argmax(self.all_fits(fitness)))
+
+    def worst_index(self, fitness):
+        '''
+        Index of the individual with the worst fitness.
+        '''
+        return int(np.argmin(self.all_fits(fitness)))
+
     def best_indv(self, fitness):
         '''
         The individual with the best fitness.
 
         '''
-        all_fits = self.all_fits(fitness)
-        return max(self.individuals,
-                   key=lambda indv: all_fits[self.individuals.index(indv)])
+        return self.individuals[self.best_index(fitness)]
 
     def worst_indv(self, fitness):
         '''
         The individual with the worst fitness.
         '''
+        return self.individuals[self.worst_index(fitness)]
+
+    def rank_order(self, fitness):
+        '''
+        Indices of the individuals sorted by ascending fitness. Cached until
+        the fitness values change, i.e. computed once per generation.
+        '''
         all_fits = self.all_fits(fitness)
-        return min(self.individuals,
-                   key=lambda indv: all_fits[self.individuals.index(indv)])
+        if self._rank_fits is not all_fits:
+            self._rank_order = np.argsort(all_fits, kind='stable')
+            self._rank_fits = all_fits
+        return self._rank_order
 
     def max(self, fitness):
         '''
         Get the maximum fitness value in population.
         '''
-        return max(self.all_fits(fitness))
+        return np.max(self.all_fits(fitness))
 
     def min(self, fitness):
         '''
         Get the minimum value of fitness in population.
         '''
-        return min(self.all_fits(fitness))
+        return np.min(self.all_fits(fitness))
 
     def mean(self, fitness):
         '''
         Get the average fitness value in population.
         '''
-        all_fits = self.all_fits(fitness)
-        return sum(all_fits)/len(all_fits)
+        return np.mean(self.all_fits(fitness))
 
     def min_t(self):
         # speed
@@ -317,10 +319,74 @@ class Population(object):
 
         return P_max
 
-    @Memoized
+    def solutions(self):
+        '''
+        Solutions of all individuals, array of shape [size, genes].
+        '''
+        return np.array([indv.solution for indv in self.individuals], dtype=float)
+
     def all_fits(self, fitness):
         '''
         Get all fitness values in population.
+
+        The values are cached per population and fitness function. After the
+        population changed only individuals with a new chromsome are
+        evaluated, e.g. the best individual carried over to the next
+        generation keeps its fitness value. Fitness functions depending on the
+        population (cacheable attribute False, like the fitness scaling
+        decorators) are evaluated for all individuals after each change.
+
+        A vectorized fitness function (registered with
+        GAEngine.batch_fitness_register) is called once with the solutions of
+        all individuals to evaluate.
         '''
-        return [fitness(indv) for indv in self.individuals]
+        cached = self._fits.get(fitness)
+        if cached is not None and cached[0] == self._version:
+            return cached[2]
+
+        cacheable = getattr(fitness, 'cacheable', True)
+        if cacheable:
+            keys = self._chromsome_keys()
+            known = cached[1] if cached is not None else {}
+        else:
+            keys = [None]*len(self)
+            known = {}
+
+        all_fits = np.empty(len(keys))
+        missing = []
+        for i, key in enumerate(keys):
+            if key in known:
+                all_fits[i] = known[key]
+            else:
+                missing.append(i)
+        if missing:
+            all_fits[missing] = self._evaluate(fitness, missing)
+
+        if cacheable:
+            # Only keep the values of the current individuals.
+            known = dict(zip(keys, all_fits))
+        self._fits[fitness] = (self._version, known, all_fits)
+        # Recover flag.
+        self._updated = False
+
+        return all_fits
+
+    def _chromsome_keys(self):
+        '''
+        Hashable chromsome of each individual, the fitness cache keys.
+        '''
+        return [tuple(indv.chromsome) for indv in self.individuals]
 
+    def _evaluate(self, fitness, indices):
+        '''
+        Fitness values of the individuals with the given indices.
+        '''
+        individuals = self.individuals
+        if self.backend is not None:
+            if hasattr(fitness, 'batch'):
+                return self.backend.evaluate(fitness, self.solutions()[indices])
+            return self.backend.evaluate(fitness, [individuals[i] for i in indices])
+
+        if hasattr(fitness, 'batch'):
+            return fitness.batch(self.solutions()[indices])
+        return [fitness(individuals[i]) for i in indices]
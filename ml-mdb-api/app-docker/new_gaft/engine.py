@@ -14,10 +14,11 @@ import os
 
 import numpy as np
 
-from .components import IndividualBase, Population
+from .components import IndividualBase, Population, ArrayPopulation
 from .plugin_interfaces.operators import Selection, Crossover, Mutation
 from .plugin_interfaces.analysis import OnTheFlyAnalysis
 from .mpiutil import mpi
+from .parallel import make_backend, offspring
 
 
 def do_profile(filename, sortby='tottime'):
@@ -88,6 +89,34 @@ class StatVar(object):
         setattr(engine, self.name, value)
 
 
+class BatchFitness(object):
+    '''
+    Fitness function for a single individual wrapping a vectorized fitness
+    function, which is its batch method. Being a module-level class, it can be
+    pickled for worker processes whenever the vectorized function can.
+    '''
+    def __init__(self, fn):
+        self.fn = fn
+        self.__doc__ = getattr(fn, '__doc__', None)
+
+    def batch(self, solutions):
+        '''
+        Vectorized fitness function with fitness values check.
+        '''
+        fitness = np.asarray(self.fn(solutions), dtype=float).reshape(-1)
+        if len(fitness) != len(solutions):
+            msg = 'Got {} fitness values for {} individuals'
+            raise ValueError(msg.format(len(fitness), len(solutions)))
+        if np.isnan(fitness).any():
+            raise ValueError('Fitness values contain NaN')
+        return fitness
+
+    def __call__(self, indv):
+        if not isinstance(indv, IndividualBase):
+            raise TypeError('indv\'s class must be subclass of IndividualBase')
+        return self.batch(np.array([indv.solution], dtype=float))[0]
+
+
 class GAEngine(object):
     '''
     Class for representing a Genetic Algorithm engine.
@@ -100,7 +129,7 @@ class GAEngine(object):
                                      StatVar('ori_fmean'))
 
     def __init__(self, population, selection, crossover, mutation,
-                 fitness=None, analysis=None):
+                 fitness=None, analysis=None, backend=None, seed=None):
         '''
         The Genetic Algorithm engine class is the central object in GAPY framework
         for running a genetic algorithm optimization. Once the population with
@@ -116,6 +145,15 @@ class GAEngine(object):
 
         :param analysis: All analysis class for on-the-fly analysis.
         :type analysis: list of OnTheFlyAnalysis subclasses.
+
+        :param backend: Optional parallel backend for offspring generation and
+                        fitness evaluation, 'serial', 'thread', 'process',
+                        'mpi' or a backend object from new_gaft.parallel.
+                        Offspring are only generated in parallel for an
+                        ArrayPopulation with array operators.
+
+        :param seed: Seed of the random numbers of the array operators, drawn
+                     from numpy.random if not provided.
         '''
         # Set logger.
         logger_name = 'gaft.{}'.format(self.__class__.__name__)
@@ -128,6 +166,8 @@ class GAEngine(object):
         self.crossover = crossover
         self.mutation = mutation
         self.analysis = [] if analysis is None else [a() for a in analysis]
+        self.backend = None if backend is None else make_backend(backend)
+        self.seed = seed
 
         # Maxima and minima in population.
         self._fmax, self._fmin, self._fmean = None, None, None
@@ -150,6 +190,20 @@ class GAEngine(object):
         if self.fitness is None:
             raise AttributeError('No fitness function in GA engine')
 
+        # Random numbers of the array operators, the same in all MPI processes.
+        seed = self.seed if self.seed is not None else np.random.randint(2**31)
+        self._rng = np.random.RandomState(mpi.bcast(seed))
+
+        self._start_backend()
+        try:
+            self._run(ng)
+        finally:
+            self._stop_backend()
+
+    def _run(self, ng):
+        '''
+        Private helper function with the evolution iteration of run.
+        '''
         self._update_statvars()
 
         # Setup analysis objects.
@@ -162,43 +216,50 @@ class GAEngine(object):
                 self.current_generation = g
                 # print ("current generation: %d"%g)
 
-                # The best individual in current population. 
-                if mpi.is_master:
-                    best_indv = self.population.best_indv(self.fitness)
+                if self.vectorized and self.backend is not None:
+                    # The offspring chunks generated by the parallel backend.
+                    self.population.chromsomes = self._reproduce_parallel()
+                elif self.vectorized:
+                    # The whole generation as array operations.
+                    self.population.chromsomes = self._reproduce_array()
                 else:
-                    best_indv = None
-                best_indv = mpi.bcast(best_indv)
-
-                # Scatter jobs to all processes.
-                local_indvs = []
-                # NOTE: One series of genetic operation generates 2 new individuals.
-                local_size = mpi.split_size(self.population.size // 2)
-                # print ("Generation %d"%g)
-
-                # Fill the new population.
-                for _ in range(local_size):
-                    # Select father and mother.
-                    parents = self.selection.select(self.population, fitness=self.fitness)
-                    # Added by @Xin 17 AUG 2018: print parents
-                    # print ("Parents: ", parents[0].solution, parents[1].solution)            
-                    # Crossover.
-                    children = self.crossover.cross(*parents)
-                    # Added by @Xin 17 AUG 2018: print children
-                    # print ("Children after crossover: ", children[0].solution, children[1].solution)                    
-                    # Mutation.
-                    children = [self.mutation.mutate(child, self) for child in children]
-                    # Added by @Xin 17 AUG 2018: print children
-                    # print ("Children after mutation: ", children[0].solution, children[1].solution)
-                    # Collect children.
+                    # The best individual in current population. 
+                    if mpi.is_master:
+                        best_indv = self.population.best_indv(self.fitness)
+                    else:
+                        best_indv = None
+                    best_indv = mpi.bcast(best_indv)
+
+                    # Scatter jobs to all processes.
+                    local_indvs = []
+                    # NOTE: One series of genetic operation generates 2 new individuals.
+                    local_size = mpi.split_size(self.population.size // 2)
+                    # print ("Generation %d"%g)
+
+                    # Fill the new population.
+                    for _ in range(local_size):
+                        # Select father and mother.
+                        parents = self.selection.select(self.population, fitness=self.fitness)
+                        # Added by @Xin 17 AUG 2018: print parents
+                        # print ("Parents: ", parents[0].solution, parents[1].solution)            
+                        # Crossover.
+                        children = self.crossover.cross(*parents)
+                        # Added by @Xin 17 AUG 2018: print children
+                        # print ("Children after crossover: ", children[0].solution, children[1].solution)                    
+                        # Mutation.
+                        children = [self.mutation.mutate(child, self) for child in children]
+                        # Added by @Xin 17 AUG 2018: print children
+                        # print ("Children after mutation: ", children[0].solution, children[1].solution)
+                        # Collect children.
                     
-                    local_indvs.extend(children)
+                        local_indvs.extend(children)
 
-                # Gather individuals from all processes.
-                indvs = mpi.merge_seq(local_indvs)
-                # Retain the previous best individual.
-                indvs[0] = best_indv
-                # The next generation.
-                self.population.individuals = indvs
+                    # Gather individuals from all processes.
+                    indvs = mpi.merge_seq(local_indvs)
+                    # Retain the previous best individual.
+                    indvs[0] = best_indv
+                    # The next generation.
+                    self.population.individuals = indvs
 
                 # Update statistic variables.
                 self._update_statvars()
@@ -220,20 +281,115 @@ class GAEngine(object):
             for a in self.analysis:
                 a.finalize(population=self.population, engine=self)
 
+    @property
+    def vectorized(self):
+        '''
+        True if the population is an ArrayPopulation and all operators have
+        array implementations.
+        '''
+        return (isinstance(self.population, ArrayPopulation)
+                and hasattr(self.selection, 'select_batch')
+                and hasattr(self.crossover, 'cross_batch')
+                and hasattr(self.mutation, 'mutate_batch'))
+
+    def _reproduce_array(self):
+        '''
+        Private helper function to create the chromsomes of the next generation
+        of an ArrayPopulation with the array implementations of the operators.
+        '''
+        # The best individual in current population.
+        if mpi.is_master:
+            best_chromsome = list(self.population.best_indv(self.fitness).chromsome)
+        else:
+            best_chromsome = None
+        best_chromsome = mpi.bcast(best_chromsome)
+
+        # NOTE: One series of genetic operation generates 2 new individuals.
+        local_size = mpi.split_size(self.population.size // 2)
+
+        chromsomes = self.population.chromsomes
+        fathers, mothers = self.selection.select_batch(self.population, self.fitness, local_size, rng=self._rng)
+        children = self.crossover.cross_batch(chromsomes[fathers], chromsomes[mothers], rng=self._rng)
+        children = self.mutation.mutate_batch(children, self, rng=self._rng)
+
+        # Gather individuals from all processes.
+        children = np.array(mpi.merge_seq(list(children)))
+        # Retain the previous best individual.
+        children[0] = best_chromsome
+
+        return children
+
+    def _reproduce_parallel(self):
+        '''
+        Private helper function to create the chromsomes of the next generation
+        of an ArrayPopulation with the parallel backend. The parents are
+        selected here, the workers cross and mutate chunks of them, each chunk
+        with a RandomState of its own seed.
+        '''
+        population = self.population
+
+        # The best individual in current population.
+        best_chromsome = list(population.best_indv(self.fitness).chromsome)
+
+        # NOTE: One series of genetic operation generates 2 new individuals.
+        npairs = population.size // 2
+        fathers, mothers = self.selection.select_batch(population, self.fitness, npairs, rng=self._rng)
+
+        chromsomes = population.chromsomes
+        chunk_size = self.backend.chunk_size
+        starts = range(0, npairs, chunk_size)
+        seeds = self._rng.randint(2**31, size=len(starts))
+        tasks = [(chromsomes[fathers[i: i+chunk_size]], chromsomes[mothers[i: i+chunk_size]], seed)
+                 for i, seed in zip(starts, seeds)]
+        children = np.concatenate(self.backend.map(offspring, tasks))
+
+        # Retain the previous best individual.
+        children[0] = best_chromsome
+
+        return children
+
+    def _start_backend(self):
+        '''
+        Private helper function to start the parallel backend and use it for
+        the fitness evaluation of the population.
+        '''
+        if self.backend is None:
+            return
+
+        if mpi.size > 1:
+            # The same initial population in all processes.
+            self.population.individuals = mpi.bcast(list(self.population.individuals))
+
+        self.backend.start({'crossover': self.crossover,
+                            'mutation': self.mutation,
+                            'fitness': [self.fitness, self.ori_fitness]})
+        self.population.backend = self.backend
+
+    def _stop_backend(self):
+        '''
+        Private helper function to stop the parallel backend.
+        '''
+        if self.backend is None:
+            return
+
+        self.population.backend = None
+        self.backend.stop()
+
     def _update_statvars(self):
         '''
         Private helper function to update statistic variables in GA engine, like
         maximum, minimum and mean values.
         '''
         # Wrt original fitness.
-        self.ori_fmax = self.population.max(self.ori_fitness)
-        self.ori_fmin = self.population.min(self.ori_fitness)
-        self.ori_fmean = self.population.mean(self.ori_fitness)
+        ori_fits = np.asarray(self.population.all_fits(self.ori_fitness))
+        self.ori_fmax, self.ori_fmin, self.ori_fmean = ori_fits.max(), ori_fits.min(), ori_fits.mean()
 
         # Wrt decorated fitness.
-        self.fmax = self.population.max(self.fitness)
-        self.fmin = self.population.min(self.fitness)
-        self.fmean = self.population.mean(self.fitness)
+        if self.fitness is self.ori_fitness:
+            fits = ori_fits
+        else:
+            fits = np.asarray(self.population.all_fits(self.fitness))
+        self.fmax, self.fmin, self.fmean = fits.max(), fits.min(), fits.mean()
 
     def _check_parameters(self):
         '''
@@ -281,6 +437,31 @@ class GAEngine(object):
         if self.ori_fitness is None:
             self.ori_fitness = _fn_with_fitness_check
 
+    def batch_fitness_register(self, fn):
+        '''
+        A decorator for vectorized fitness function register.
+
+        The function gets the solutions of all individuals as an array of shape
+        [size, genes] and returns their fitness values as an array of shape
+        [size]. It can be combined with the fitness scaling decorators, their
+        original function is then vectorized as well.
+        '''
+        self.fitness = self._batch_fitness(fn)
+        if self.ori_fitness is None:
+            self.ori_fitness = self.fitness
+        elif not hasattr(self.ori_fitness, 'batch'):
+            # Original function set by a fitness scaling decorator.
+            self.ori_fitness = self._batch_fitness(self.ori_fitness)
+
+    @staticmethod
+    def _batch_fitness(fn):
+        '''
+        Private helper function to wrap a vectorized fitness function. The
+        vectorized function is the batch attribute of the returned fitness
+        function for a single individual.
+        '''
+        return BatchFitness(fn)
+
     def analysis_register(self, analysis_cls):
         '''
         A decorator for analysis regsiter.
@@ -326,6 +507,9 @@ class GAEngine(object):
                     raise ValueError('Invalid target type({})'.format(target))
                 return f_prime
 
+            # Depends on the population, must not be cached per chromsome.
+            _fn_with_linear_scaling.cacheable = False
+
             return _fn_with_linear_scaling
 
         return _linear_scaling
@@ -366,6 +550,9 @@ class GAEngine(object):
                     raise ValueError('Invalid target type({})'.format(target))
                 return f_prime
 
+            # Depends on the population, must not be cached per chromsome.
+            _fn_with_dynamic_linear_scaling.cacheable = False
+
             return _fn_with_dynamic_linear_scaling
 
         return _dynamic_linear_scaling
@@ -7,6 +7,7 @@ from random import random
 from numpy.random import normal, uniform
 from copy import deepcopy
 from math import *
+import numpy as np
 
 from ...plugin_interfaces.operators.crossover import Crossover
 
@@ -76,3 +77,35 @@ class IntermediateCrossover(Crossover):
 
         return child1, child2
 
+    def cross_batch(self, fathers, mothers, rng=None):
+        '''
+        Cross the chromsome arrays of n pairs of parents at once.
+
+        :param fathers: Chromsomes of the fathers, array of shape [n, genes].
+        :param mothers: Chromsomes of the mothers, array of shape [n, genes].
+        :param rng: numpy RandomState, the numpy.random module by default.
+
+        :return children: Array of shape [2n, genes], the two children of
+                          each pair one after another.
+        '''
+        rng = np.random if rng is None else rng
+        chrom1 = np.array(fathers, dtype=float)
+        chrom2 = np.array(mothers, dtype=float)
+        n = len(chrom1)
+
+        do_cross = rng.random_sample(n) <= self.pc
+        interval = self.pe
+
+        # only perform crossover for the mean of the speed
+        alpha = rng.uniform(-interval, 1+interval, n)
+        speed1 = np.maximum(np.minimum(self.max_speed, chrom1[:, 0] + alpha * (chrom2[:, 0] - chrom1[:, 0])), self.min_speed)
+        alpha = rng.uniform(-interval, 1+interval, n)
+        speed2 = np.maximum(np.minimum(self.max_speed, chrom2[:, 0] + alpha * (speed1 - chrom2[:, 0])), self.min_speed)
+        chrom1[do_cross, 0] = speed1[do_cross]
+        chrom2[do_cross, 0] = speed2[do_cross]
+
+        children = np.empty((2*n, chrom1.shape[1]))
+        children[0::2] = chrom1
+        children[1::2] = chrom2
+
+        return children
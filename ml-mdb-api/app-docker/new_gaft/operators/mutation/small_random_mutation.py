@@ -7,6 +7,8 @@ from random import random
 from numpy.random import normal, uniform
 import json
 
+import numpy as np
+
 from ...mpiutil import mpi
 from ...plugin_interfaces.operators.mutation import Mutation
 from ...components.floating_point_individual import FloatingPointIndividual
@@ -86,4 +88,41 @@ class SmallRandomMutation(Mutation):
         # Update solution.
         individual.solution = individual.decode()
 
-        return individual
\ No newline at end of file
+        return individual
+
+    def mutate_batch(self, chromsomes, engine, rng=None):
+        '''
+        Mutate the chromsome array of n individuals at once.
+
+        :param chromsomes: Array of shape [n, genes].
+        :param rng: numpy RandomState, the numpy.random module by default.
+
+        :return chromsomes: The mutated copy of the array.
+        '''
+        rng = np.random if rng is None else rng
+        chromsomes = np.array(chromsomes, dtype=float)
+        min_speed = self.min_speed
+        max_speed = self.max_speed
+        int_speed = self.int_speed
+
+        do_mutation = rng.random_sample(len(chromsomes)) <= self.pm
+        chromsomes[do_mutation, 0] += self.pe*rng.normal(0, 1, do_mutation.sum())
+
+        # speed range: [min_speed, max_speed], put into pre-defined interval
+        speed = np.maximum(np.minimum(max_speed-int_speed*0.5, chromsomes[:, 0]), min_speed)
+        chromsomes[:, 0] = ((speed - min_speed) // int_speed) * int_speed + min_speed
+        # historical upper bound speed and powers
+        chromsomes[:, 1] = chromsomes[:, 0] + int_speed
+        chromsomes[:, 2] = self._power(chromsomes[:, 0])
+        chromsomes[:, 3] = self._power(chromsomes[:, 1])
+
+        return chromsomes
+
+    def _power(self, speeds):
+        '''
+        Power of each speed. The speeds lie on the interval grid, so the power
+        calculation only runs once per distinct speed.
+        '''
+        distinct, inverse = np.unique(speeds, return_inverse=True)
+        powers = np.array([self.power_calc.calculation(speed, self.torque) for speed in distinct])
+        return powers[inverse]
@@ -7,6 +7,8 @@ from random import random
 from itertools import accumulate
 from bisect import bisect_right
 
+import numpy as np
+
 from ...plugin_interfaces.operators.selection import Selection
 
 
@@ -22,6 +24,9 @@ class LinearRankingSelection(Selection):
         # Selection probabilities for the worst and best individuals.
         self.pmin, self.pmax = pmin, pmax
 
+        # Cumulative rank probabilities and the population size they are for.
+        self._wheel_values, self._wheel_size = None, None
+
     def select(self, population, fitness):
         '''
         Select a pair of parent individuals using linear ranking method.
@@ -29,26 +34,50 @@ class LinearRankingSelection(Selection):
         # Individual number.
         NP = len(population)
 
-        # Add rank to all individuals in population.
-        all_fits = population.all_fits(fitness)
-        indvs = population.individuals
-        sorted_indvs = sorted(indvs,
-                              key=lambda indv: all_fits[indvs.index(indv)])
-
-        # Assign selection probabilities linearly.
-        # NOTE: Here the rank i belongs to {1, ..., N}
-        p = lambda i: (self.pmin + (self.pmax - self.pmin)*(i-1)/(NP-1))
-        probabilities = [self.pmin] + [p(i) for i in range(2, NP)] + [self.pmax]
-
-        # Normalize probabilities.
-        psum = sum(probabilities)
-        wheel = list(accumulate([p/psum for p in probabilities]))
+        # Rank order of all individuals in population.
+        order = population.rank_order(fitness)
+        wheel = self._wheel(NP)
 
         # Select parents.
-        father_idx = bisect_right(wheel, random())
-        father = sorted_indvs[father_idx]
+        father_idx = min(bisect_right(wheel, random()), NP - 1)
         mother_idx = (father_idx + 1) % len(wheel)
-        mother = sorted_indvs[mother_idx]
+        father = population.individuals[order[father_idx]]
+        mother = population.individuals[order[mother_idx]]
 
         return father, mother
 
+    def select_batch(self, population, fitness, n, rng=None):
+        '''
+        Select n pairs of parents at once for an ArrayPopulation.
+
+        :param rng: numpy RandomState, the numpy.random module by default.
+
+        :return fathers, mothers: Index arrays of the selected individuals.
+        '''
+        rng = np.random if rng is None else rng
+        NP = len(population)
+        order = population.rank_order(fitness)
+        wheel = self._wheel(NP)
+
+        father_idx = np.minimum(np.searchsorted(wheel, rng.random_sample(n), side='right'), NP - 1)
+        mother_idx = (father_idx + 1) % NP
+
+        return order[father_idx], order[mother_idx]
+
+    def _wheel(self, NP):
+        '''
+        Cumulative selection probabilities of the ranks for NP individuals.
+        Only depends on NP, so it is computed once.
+        '''
+        if self._wheel_size != NP:
+            # Assign selection probabilities linearly.
+            # NOTE: Here the rank i belongs to {1, ..., N}
+            p = lambda i: (self.pmin + (self.pmax - self.pmin)*(i-1)/(NP-1))
+            probabilities = [self.pmin] + [p(i) for i in range(2, NP)] + [self.pmax]
+
+            # Normalize probabilities.
+            psum = sum(probabilities)
+            self._wheel_values = np.array(list(accumulate([p/psum for p in probabilities])))
+            self._wheel_size = NP
+        return self._wheel_values
+
@@ -5,6 +5,8 @@
 
 from random import sample
 
+import numpy as np
+
 from ...plugin_interfaces.operators.selection import Selection
 
 
@@ -20,25 +22,49 @@ class TournamentSelection(Selection):
         '''
         Select a pair of parent using Tournament strategy.
         '''
-        # Competition function.
         all_fits = population.all_fits(fitness)
-        def complete(competitors):
-            '''
-            Competition function.
-            '''
-            key = lambda indv: all_fits[population.individuals.index(indv)]
-            # return max(competitors, key=key)
-            return min(competitors, key=key)
 
         # Check validity of tournament size.
         if self.tournament_size >= len(population):
             msg = 'Tournament size({}) is larger than population size({})'
             raise ValueError(msg.format(self.tournament_size, len(population)))
 
-        # Pick winners of two groups as parent.
-        competitors_1 = sample(population.individuals, self.tournament_size)
-        competitors_2 = sample(population.individuals, self.tournament_size)
-        father, mother = complete(competitors_1), complete(competitors_2)
+        # Pick winners of two groups as parent, competing by their indices.
+        competitors_1 = sample(range(len(population)), self.tournament_size)
+        competitors_2 = sample(range(len(population)), self.tournament_size)
+        # father = max(competitors_1, key=all_fits.__getitem__)
+        father = min(competitors_1, key=all_fits.__getitem__)
+        mother = min(competitors_2, key=all_fits.__getitem__)
+
+        return population.individuals[father], population.individuals[mother]
+
+    def select_batch(self, population, fitness, n, rng=None):
+        '''
+        Select n pairs of parents at once for an ArrayPopulation.
+
+        :param rng: numpy RandomState, the numpy.random module by default.
+
+        :return fathers, mothers: Index arrays of the selected individuals.
+        '''
+        rng = np.random if rng is None else rng
+        all_fits = np.asarray(population.all_fits(fitness))
+        NP = len(all_fits)
+
+        # Check validity of tournament size.
+        if self.tournament_size >= NP:
+            msg = 'Tournament size({}) is larger than population size({})'
+            raise ValueError(msg.format(self.tournament_size, NP))
+
+        # One group of competitors per row, drawn without replacement like
+        # sample(): groups containing an individual twice are drawn again.
+        competitors = rng.randint(0, NP, size=(2*n, self.tournament_size))
+        while True:
+            sorted_competitors = np.sort(competitors, axis=1)
+            repeated = (np.diff(sorted_competitors, axis=1) == 0).any(axis=1)
+            if not repeated.any():
+                break
+            competitors[repeated] = rng.randint(0, NP, size=(repeated.sum(), self.tournament_size))
 
-        return father, mother
+        winners = competitors[np.arange(2*n), np.argmin(all_fits[competitors], axis=1)]
 
+        return winners[0::2], winners[1::2]
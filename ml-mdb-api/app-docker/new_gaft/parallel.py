@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Pluggable backends for parallelizing offspring generation and fitness
+evaluation of the Genetic Algorithm on local cores (threads or processes) or
+in a distributed MPI environment.
+
+The offspring of a generation are produced in chunks of chunk_size pairs of
+parents, each chunk with its own RandomState seeded by the engine, so a run
+with a given seed gives the same result with every backend and number of
+workers.
+'''
+
+import atexit
+import multiprocessing
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from .mpiutil import mpi
+
+
+# Long-lived worker pools of this process by (start method, workers), shared
+# by all engines, so the workers are started (and import the modules) once.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def offspring(context, task):
+    '''
+    Cross and mutate one chunk of parents.
+
+    :param task: (chromsomes of the fathers, chromsomes of the mothers, seed)
+
+    :return children: Array of shape [2n, genes].
+    '''
+    fathers, mothers, seed = task
+    rng = np.random.RandomState(seed)
+    children = context['crossover'].cross_batch(fathers, mothers, rng=rng)
+    return context['mutation'].mutate_batch(children, None, rng=rng)
+
+
+def evaluate(context, task):
+    '''
+    Fitness values of one chunk of individuals.
+
+    :param task: (index of the fitness function, solutions array for a
+                 vectorized fitness function or list of individuals)
+    '''
+    index, items = task
+    fitness = context['fitness'][index]
+    if hasattr(fitness, 'batch'):
+        return fitness.batch(items)
+    return [fitness(indv) for indv in items]
+
+
+def _call(func, context, task):
+    '''
+    Task function of the worker processes, the context of the engine is sent
+    with the tasks.
+    '''
+    return func(context, task)
+
+
+def _picklable(obj):
+    '''
+    Whether obj can be sent to a spawned worker process.
+    '''
+    try:
+        pickle.dumps(obj)
+        return True
+    except Exception:
+        return False
+
+
+def process_pool(workers, start_method='spawn'):
+    '''
+    The long-lived pool of worker processes of this process, created on first
+    use. multiprocessing pools may be used by several threads at once.
+    '''
+    key = (start_method, workers)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = multiprocessing.get_context(start_method).Pool(workers)
+        return _pools[key]
+
+
+@atexit.register
+def close_pools():
+    '''
+    Stop the worker processes of all pools.
+    '''
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.terminate()
+        pool.join()
+
+
+class SerialBackend(object):
+    '''
+    Runs all tasks in the calling process, the reference for the other backends.
+    '''
+    name = 'serial'
+
+    def __init__(self, workers=None, chunk_size=8):
+        '''
+        :param workers: Number of worker threads or processes, all cores by default.
+        :param chunk_size: Number of pairs of parents per offspring task. The
+                           results depend on it, but not on the backend.
+        '''
+        self.workers = int(workers) if workers else multiprocessing.cpu_count()
+        self.chunk_size = int(chunk_size)
+        self.context = None
+
+    def start(self, context):
+        '''
+        Called by the engine before the evolution iteration.
+
+        :param context: dict with the crossover and mutation operators and the
+                        list of fitness functions of the engine.
+        '''
+        self.context = context
+
+    def stop(self):
+        '''
+        Called by the engine after the evolution iteration.
+        '''
+        self.context = None
+
+    def map(self, func, tasks):
+        '''
+        Run func(context, task) for all tasks.
+
+        :return: list of the results in the order of the tasks.
+        '''
+        return [func(self.context, task) for task in tasks]
+
+    def fitness_index(self, fitness):
+        '''
+        Index of the fitness function in the context, None if the workers
+        cannot evaluate it.
+        '''
+        if self.context is None:
+            return None
+        for i, fn in enumerate(self.context['fitness']):
+            if fn is fitness:
+                return i
+        return None
+
+    def evaluate(self, fitness, items):
+        '''
+        Evaluate the fitness function on chunks of the items in parallel.
+
+        :param items: solutions array for a vectorized fitness function or
+                      list of individuals.
+
+        :return: fitness values, array of shape [len(items)].
+        '''
+        index = self.fitness_index(fitness)
+        if index is None or self.workers == 1 or len(items) < 2:
+            return np.asarray(evaluate({'fitness': [fitness]}, (0, items)), dtype=float)
+
+        step = -(-len(items) // self.workers)
+        tasks = [(index, items[i: i+step]) for i in range(0, len(items), step)]
+        return np.concatenate([np.asarray(r, dtype=float) for r in self.map(evaluate, tasks)])
+
+
+class ThreadBackend(SerialBackend):
+    '''
+    Runs the tasks in a pool of threads. Efficient when the fitness function
+    and the operators spend their time in NumPy.
+    '''
+    name = 'thread'
+
+    def start(self, context):
+        super(ThreadBackend, self).start(context)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def stop(self):
+        self._executor.shutdown()
+        super(ThreadBackend, self).stop()
+
+    def map(self, func, tasks):
+        return list(self._executor.map(partial(func, self.context), tasks))
+
+
+class ProcessBackend(SerialBackend):
+    '''
+    Runs the tasks in the long-lived process pool of this process (see
+    process_pool), the context is pickled with the tasks. Fitness functions
+    depending on the population (cacheable attribute False, like the fitness
+    scaling decorators) or which cannot be pickled (e.g. closures, register a
+    module-level callable class instead) are evaluated in the calling process.
+
+    The workers are spawned by default: forking a multi-threaded process,
+    like the request threads of the web server, can deadlock the children.
+    Single-threaded scripts may use start_method='fork'.
+    '''
+    name = 'process'
+
+    def __init__(self, workers=None, chunk_size=8, start_method='spawn'):
+        '''
+        :param start_method: multiprocessing start method of the workers,
+                             'spawn', 'forkserver' or 'fork'.
+        '''
+        super(ProcessBackend, self).__init__(workers=workers, chunk_size=chunk_size)
+        self.start_method = start_method
+
+    def start(self, context):
+        fitness = [fn if getattr(fn, 'cacheable', True) and _picklable(fn) else None
+                   for fn in context['fitness']]
+        context = dict(context, fitness=fitness)
+        super(ProcessBackend, self).start(context)
+        self._pool = process_pool(self.workers, self.start_method)
+
+    def stop(self):
+        # The pool is kept for the next run.
+        self._pool = None
+        super(ProcessBackend, self).stop()
+
+    def map(self, func, tasks):
+        return self._pool.map(partial(_call, func, self.context), tasks)
+
+
+class MPIBackend(SerialBackend):
+    '''
+    Distributes the tasks over all MPI processes. Every process runs the same
+    engine, computes its share of the tasks and gathers all results.
+    '''
+    name = 'mpi'
+
+    def __init__(self, workers=None, chunk_size=8):
+        super(MPIBackend, self).__init__(workers=mpi.size, chunk_size=chunk_size)
+
+    def map(self, func, tasks):
+        local = [(i, func(self.context, tasks[i])) for i in range(mpi.rank, len(tasks), mpi.size)]
+        merged = sorted(mpi.merge_seq(local), key=lambda result: result[0])
+        return [result for _, result in merged]
+
+
+BACKENDS = {
+    SerialBackend.name: SerialBackend,
+    ThreadBackend.name: ThreadBackend,
+    ProcessBackend.name: ProcessBackend,
+    MPIBackend.name: MPIBackend,
+}
+
+
+def make_backend(backend, workers=None, chunk_size=8):
+    '''
+    Create a backend by name.
+
+    :param backend: 'serial', 'thread', 'process' or 'mpi', or a backend object
+                    which is returned unchanged.
+    '''
+    if isinstance(backend, SerialBackend):
+        return backend
+    if backend not in BACKENDS:
+        msg = 'Unknown backend {} (Only supports {}).'
+        raise ValueError(msg.format(backend, ', '.join(sorted(BACKENDS))))
+    return BACKENDS[backend](workers=workers, chunk_size=chunk_size)